@@ -1,6 +1,8 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.signals import worker_process_shutdown, worker_ready
+from celery.utils.log import get_logger
 
 # Установка переменной окружения для настроек проекта
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -19,3 +21,34 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 app.conf.broker_connection_retry_on_startup = True
+
+logger = get_logger(__name__)
+
+
+@worker_ready.connect
+def start_metrics_server(sender=None, **kwargs):
+    """
+    HTTP-сервер метрик Prometheus воркера на порту CELERY_METRICS_PORT.
+    Задачи пула prefork выполняются в дочерних процессах, и их метрики видны главному
+    процессу только через каталог PROMETHEUS_MULTIPROC_DIR: без него сервер не запускается.
+    """
+
+    port = os.getenv('CELERY_METRICS_PORT')
+    if not port:
+        return
+    from celery.concurrency.prefork import TaskPool
+    if isinstance(getattr(sender, 'pool', None), TaskPool) and not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        logger.warning('Метрики воркера не публикуются: для пула prefork нужен PROMETHEUS_MULTIPROC_DIR')
+        return
+    from prometheus_client import start_http_server
+
+    from config.metrics import get_registry
+    start_http_server(int(port), registry=get_registry())
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    # метрики завершившегося дочернего процесса (prefork) больше не собираются как живые
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,26 @@
+import csv
+
+import orjson
+
+
+class Echo:
+    """ Псевдофайл для csv.writer: возвращает записанную строку вместо буферизации """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    """ Строки CSV (заголовок и по строке на запись) для StreamingHttpResponse """
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row])
+
+
+def ndjson_lines(fields, rows):
+    """ Строки NDJSON (по JSON-объекту на запись) для StreamingHttpResponse """
+
+    for row in rows:
+        yield orjson.dumps(dict(zip(fields, row))) + b'\n'
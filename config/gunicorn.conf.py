@@ -0,0 +1,64 @@
+"""
+Настройки gunicorn для продакшена: gunicorn -c config/gunicorn.conf.py config.wsgi:application
+
+Число воркеров и потоков вычисляется по доступным процессу CPU (с учётом ограничений
+контейнера через sched_getaffinity) и переопределяется переменными окружения GUNICORN_*.
+Для ASGI (habits.async_views): GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker
+и config.asgi:application; потоки в этом режиме не используются.
+
+При постоянных подключениях к БД (DB_CONN_MAX_AGE) каждый поток держит своё подключение:
+воркеры * потоки не должны превышать max_connections PostgreSQL.
+"""
+import glob
+import os
+
+try:
+    cpu_count = len(os.sched_getaffinity(0))
+except AttributeError:
+    cpu_count = os.cpu_count() or 1
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', cpu_count * 2 + 1))
+# потоки позволяют воркеру обслуживать другие запросы, пока один ждёт БД, Redis или клиента
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+# приложение загружается один раз в главном процессе до fork: воркеры разделяют
+# его память (copy-on-write) и стартуют быстрее. Подключения к БД и Redis при импорте
+# не открываются, поэтому общих сокетов у воркеров нет
+preload_app = True
+
+# перезапуск воркера после max_requests запросов (со случайным разбросом, чтобы воркеры
+# не перезапускались одновременно) ограничивает рост памяти из-за утечек и фрагментации
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# за nginx соединения переиспользуются, keep-alive чуть дольше, чем у прокси
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 75))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+# временные файлы воркеров в памяти, а не на диске контейнера
+worker_tmp_dir = os.getenv('GUNICORN_WORKER_TMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+
+# каталог метрик (см. config.metrics) нужен уже при загрузке приложения (preload_app)
+multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if multiproc_dir:
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def on_starting(server):
+    # метрики прошлого запуска не должны попасть в новые; файлы главного процесса
+    # тоже удаляются - он запросы не обслуживает, а воркеры пишут в свои файлы
+    if multiproc_dir:
+        for path in glob.glob(os.path.join(multiproc_dir, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    # метрики-gauge завершившегося воркера больше не учитываются как живые
+    if multiproc_dir:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,71 @@
+import ipaddress
+import os
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# API
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса',
+    ['view', 'action', 'method', 'status'],
+)
+DB_QUERIES = Counter('db_queries', 'SQL-запросы при обработке запросов API', ['view', 'action'])
+DB_QUERY_TIME = Counter('db_query_duration_seconds', 'Время SQL-запросов при обработке запросов API',
+                        ['view', 'action'])
+# cache: public_habits - страницы публичных привычек, auth_user - пользователи JWT-аутентификации;
+# result: hit / miss (для auth_user попадания делятся на local и shared)
+CACHE_REQUESTS = Counter('cache_requests', 'Обращения к кэшам', ['cache', 'result'])
+
+# Рассылка напоминаний
+
+REMINDER_TICK_DURATION = Histogram('habits_reminder_tick_duration_seconds',
+                                   'Длительность запуска задачи send_tg_message')
+REMINDER_DUE = Histogram('habits_reminder_due', 'Напоминаний за один запуск send_tg_message',
+                         buckets=(0, 1, 10, 100, 1000, 10000, 100000, float('inf')))
+# result: sent / failed; skipped - не отправленные напоминания о прошедших наступлениях (простой планировщика)
+REMINDER_MESSAGES = Counter('habits_reminder_messages', 'Отправленные напоминания', ['result'])
+REMINDER_LATENESS = Histogram('habits_reminder_lateness_seconds',
+                              'Опоздание напоминания: время отправки минус запланированное',
+                              buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, float('inf')))
+
+
+def get_registry():
+    """
+    Реестр для выдачи метрик. При нескольких процессах (воркеры gunicorn, prefork Celery)
+    каждый процесс пишет метрики в каталог PROMETHEUS_MULTIPROC_DIR, и они собираются оттуда.
+    Каталог должен очищаться при старте сервиса.
+    """
+
+    if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def is_metrics_allowed(request):
+    """ Метрики доступны персоналу и адресам из METRICS_ALLOWED_NETWORKS """
+
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network.strip(), strict=False)
+               for network in settings.METRICS_ALLOWED_NETWORKS if network.strip())
+
+
+def metrics_view(request):
+    """ Метрики в текстовом формате Prometheus """
+
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not is_metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,153 @@
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+
+from config import metrics
+from config.timing import acollect_timings, collect_timings
+
+logger = logging.getLogger('config.timing')
+
+
+class SizeThresholdGZipMiddleware(GZipMiddleware):
+    """ Сжимает ответы размером от GZIP_MIN_LENGTH байт: маленьким ответам сжатие не окупается """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.GZIP_MIN_LENGTH:
+            return response
+        return super().process_response(request, response)
+
+
+class AsyncCapableMiddleware(ABC):
+    """
+    Основа middleware, работающих и в WSGI, и в ASGI: в асинхронной цепочке запрос
+    обрабатывается в __acall__, без перехода в поток, который Django добавил бы
+    для синхронного middleware. Наследники реализуют обе версии обработки.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.handle(request)
+
+    @abstractmethod
+    def handle(self, request):
+        """ Обработка запроса в синхронной цепочке """
+
+    @abstractmethod
+    async def __acall__(self, request):
+        """ Обработка запроса в асинхронной цепочке """
+
+
+class ServerTimingMiddleware(AsyncCapableMiddleware):
+    """
+    Замеры запроса: число SQL-запросов и время в БД, сериализации, аутентификации и во view
+    (view - всё время обработки запроса, остальные этапы входят в него).
+    Отдаются в заголовке Server-Timing и в строке лога config.timing (JSON);
+    одинаковые по виду SQL-запросы, повторённые SERVER_TIMING_REPEATED_QUERIES раз и больше,
+    логируются как возможный N+1.
+    Включается настройкой SERVER_TIMING, выключенный не добавляется в цепочку middleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        started = time.perf_counter()
+        with collect_timings(track_shapes=True) as timings:
+            response = self.get_response(request)
+            timings.add('view', started)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        async with acollect_timings(track_shapes=True) as timings:
+            response = await self.get_response(request)
+            timings.add('view', started)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        entries = [f'{name};dur={duration:.1f}' for name, duration in timings.durations.items()]
+        entries.append(f'queries;desc="{timings.queries}"')
+        response['Server-Timing'] = ', '.join(entries)
+        self.log(request, response, timings)
+        return response
+
+    def log(self, request, response, timings):
+        repeated = timings.repeated_queries(settings.SERVER_TIMING_REPEATED_QUERIES)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timings.queries,
+            **{f'{name}_ms': round(duration, 1) for name, duration in timings.durations.items()},
+        }
+        if repeated:
+            record['repeated_queries'] = [{'sql': shape, 'count': count} for shape, count in repeated]
+            logger.warning('Возможный N+1: %s', json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info('%s', json.dumps(record, ensure_ascii=False))
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Метрики Prometheus для каждого запроса: задержка, число SQL-запросов и время в БД
+    с метками view и action (действие viewset), а не пути, чтобы число рядов не росло
+    вместе с количеством id. Считаются только время и число SQL-запросов, без группировки
+    по виду (её собирает ServerTimingMiddleware). Выключается настройкой METRICS_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        started = time.perf_counter()
+        with collect_timings() as timings:
+            before = timings.snapshot()
+            response = self.get_response(request)
+            self.observe(request, response, started, before, timings.snapshot())
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        async with acollect_timings() as timings:
+            before = timings.snapshot()
+            response = await self.get_response(request)
+            self.observe(request, response, started, before, timings.snapshot())
+        return response
+
+    def observe(self, request, response, started, before, after):
+        queries, db_time = after[0] - before[0], after[1] - before[1]
+        view, action = self.get_view_labels(request)
+        metrics.REQUEST_LATENCY.labels(view, action, request.method, response.status_code).observe(
+            time.perf_counter() - started
+        )
+        metrics.DB_QUERIES.labels(view, action).inc(queries)
+        metrics.DB_QUERY_TIME.labels(view, action).inc(db_time / 1000)
+
+    @staticmethod
+    def get_view_labels(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unmatched', ''
+        view = getattr(match.func, 'cls', None) or match.func
+        actions = getattr(match.func, 'actions', None) or {}
+        return view.__name__, actions.get(request.method.lower(), request.method.lower())
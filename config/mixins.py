@@ -0,0 +1,143 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from config.timing import timer
+
+
+def get_sparse_fields(request):
+    """
+    Запрошенные клиентом поля: ?fields=id,action - только эти поля, ?omit=reward - все, кроме этих.
+    Учитываются только в читающих запросах, первичный ключ id отдаётся всегда.
+    """
+
+    if request is None or request.method not in SAFE_METHODS:
+        return None, set()
+    fields = {name for name in request.query_params.get('fields', '').split(',') if name}
+    omit = {name for name in request.query_params.get('omit', '').split(',') if name}
+    if fields:
+        fields.add('id')
+    omit.discard('id')
+    return fields or None, omit
+
+
+class SparseFieldsSerializerMixin:
+    """ Убирает из сериализатора поля, не запрошенные клиентом (см. get_sparse_fields) """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, omit = get_sparse_fields(self.context.get('request'))
+        for name in list(self.fields):
+            if (fields is not None and name not in fields) or name in omit:
+                self.fields.pop(name)
+
+
+class TimedSerializerMixin:
+    """ Время сериализации учитывается в замерах запроса (ServerTimingMiddleware) """
+
+    def to_representation(self, instance):
+        with timer('serializer'):
+            return super().to_representation(instance)
+
+
+class SparseFieldsMixin:
+    """
+    Переносит ?fields= / ?omit= в запрос к БД: незапрошенные колонки не читаются (.only()/.defer()).
+    sparse_required_fields - колонки, которые нужны view независимо от запроса
+    (проверка прав, ETag), sparse_field_columns - колонки, из которых строится поле
+    сериализатора, если их несколько ({'avatar': ('avatar', 'avatar_thumbnails')}).
+    """
+
+    sparse_required_fields = ('id',)
+    sparse_field_columns = {}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields, omit = get_sparse_fields(self.request)
+        model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        if fields is not None:
+            columns = {column for name in fields for column in self.sparse_field_columns.get(name, ())}
+            return queryset.only(*((fields | columns) & model_fields | set(self.sparse_required_fields)))
+        if omit:
+            kept = {column for name, columns in self.sparse_field_columns.items() if name not in omit
+                    for column in columns}
+            return queryset.defer(*(omit & model_fields - set(self.sparse_required_fields) - kept))
+        return queryset
+
+    def trim_fields(self, items):
+        """ Оставляет запрошенные поля в уже сериализованных данных (например, из кэша) """
+
+        fields, omit = get_sparse_fields(self.request)
+        if fields is None and not omit:
+            return items
+        return [
+            {name: value for name, value in item.items()
+             if (fields is None or name in fields) and name not in omit}
+            for item in items
+        ]
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы: ETag и Last-Modified по колонке updated_at для retrieve, только ETag для list.
+    Валидаторы вычисляются без сериализации: для объекта - по его updated_at,
+    для списка - по версии из get_list_version (по умолчанию одним агрегирующим запросом:
+    max(updated_at) и количество строк; view с дешёвой версией данных переопределяют его,
+    а view, которым агрегат по всей таблице не по карману, отключают ETag списка, возвращая None).
+    Last-Modified у списка нет: max(updated_at) не меняется при удалении, и клиент,
+    отправляющий только If-Modified-Since, получил бы устаревший 304.
+    На совпавшие If-None-Match / If-Modified-Since отвечает 304 до сериализации.
+    """
+
+    def get_representation_key(self, request):
+        # одна и та же версия данных по-разному выглядит в разных форматах и с разными параметрами
+        key = f'{request.get_full_path()}|{request.META.get("HTTP_ACCEPT", "")}'
+        return hashlib.md5(key.encode()).hexdigest()[:12]
+
+    def get_validators(self, request, version, updated_at):
+        etag = f'"{version}-{self.get_representation_key(request)}"'
+        last_modified = int(updated_at.timestamp()) if updated_at else None
+        return etag, last_modified
+
+    def conditional_response(self, request, validators, get_response):
+        etag, last_modified = validators
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        validators = self.get_validators(
+            request, f'{instance.pk}-{instance.updated_at.timestamp()}', instance.updated_at
+        )
+        return self.conditional_response(request, validators, lambda: Response(self.get_serializer(instance).data))
+
+    def get_list_version(self, request):
+        """
+        Версия списка: меняется при любом изменении его элементов, в том числе удалении.
+        None - список отдаётся без ETag.
+        """
+
+        queryset = self.filter_queryset(self.get_queryset())
+        state = queryset.order_by().aggregate(updated_at=Max('updated_at'), count=Count('pk'))
+        updated_at = state['updated_at']
+        return f'{request.user.pk}-{state["count"]}-{updated_at.timestamp() if updated_at else 0}'
+
+    def list(self, request, *args, **kwargs):
+        version = self.get_list_version(request)
+        if version is None:
+            return self.get_list_response(request, *args, **kwargs)
+        validators = self.get_validators(request, version, None)
+        return self.conditional_response(request, validators, lambda: self.get_list_response(request, *args, **kwargs))
+
+    def get_list_response(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
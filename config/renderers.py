@@ -0,0 +1,35 @@
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# типы, которые не сериализуются напрямую (ленивые строки переводов и т.п.),
+# преобразуются так же, как в стандартном JSONRenderer
+encode_default = JSONEncoder().default
+
+
+class ORJSONRenderer(BaseRenderer):
+    """ JSON на основе orjson """
+
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """ MessagePack, выбирается клиентом заголовком Accept: application/msgpack """
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 import os
 from datetime import timedelta
 from pathlib import Path
+
+import django
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -27,6 +30,9 @@ SECRET_KEY = 'django-insecure-b&c)b2t)yik-04@fd(k)7max+lm4xp*u43p=6l^_ppcc&gwo-%
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv('DEBUG') == 'True'
 
+# local - разработка, иначе - продакшен (постоянные подключения к БД, collectstatic в STATIC_ROOT)
+ENV_TYPE = os.getenv('ENV_TYPE')
+
 ALLOWED_HOSTS = [os.getenv('ALLOWED_HOSTS')]
 
 
@@ -51,6 +57,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'config.middleware.ServerTimingMiddleware',
+    'config.middleware.MetricsMiddleware',
+    'config.middleware.SizeThresholdGZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,9 +101,52 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'PORT': os.getenv('POSTGRES_PORT'),
         'HOST': os.getenv('POSTGRES_HOST'),
+        # подключение живёт DB_CONN_MAX_AGE сек. и переиспользуется следующими запросами,
+        # поэтому установка соединения (TCP, TLS, аутентификация) не входит в задержку каждого запроса;
+        # перед переиспользованием проверяется, что подключение живо
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0 if ENV_TYPE == 'local' else 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Пул подключений psycopg 3 (Django 5.1+): нужен под ASGI, где постоянные подключения
+# не переиспользуются между запросами, и когда воркеров больше, чем допускает max_connections.
+# Каждый процесс держит свой пул: всего до DB_POOL_MAX_SIZE * число воркеров подключений
+if os.getenv('DB_POOL') == 'True':
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        psycopg_pool = None
+    if django.VERSION < (5, 1) or psycopg_pool is None:
+        raise ImproperlyConfigured('DB_POOL требует Django 5.1+ и psycopg 3: pip install "psycopg[binary,pool]"')
+    DATABASES['default']['OPTIONS'] = {'pool': {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+    }}
+    # подключениями управляет пул, постоянные подключения Django с ним несовместимы
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Redis при заданном CACHE_URL (например, redis://redis:6379/2), иначе кэш в памяти процесса
+
+CACHE_URL = os.getenv('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -133,12 +185,14 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
 STATIC_URL = 'static/'
-ENV_TYPE = os.getenv('ENV_TYPE')
 if ENV_TYPE == 'local':
     STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 else:
     STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -148,18 +202,87 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.renderers.ORJSONRenderer',
+        'config.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'config.parsers.ORJSONParser',
+        'config.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Ответы от этого размера (байт) сжимаются gzip, если клиент его поддерживает
+GZIP_MIN_LENGTH = 1024
+
+# Замеры запросов в заголовке Server-Timing и логе config.timing (ServerTimingMiddleware)
+SERVER_TIMING = os.getenv('SERVER_TIMING') == 'True'
+# Сколько одинаковых по виду SQL-запросов за один запрос считать признаком N+1
+SERVER_TIMING_REPEATED_QUERIES = int(os.getenv('SERVER_TIMING_REPEATED_QUERIES', 10))
+
+# Метрики Prometheus (MetricsMiddleware и /metrics), по умолчанию выключены.
+# /metrics доступен персоналу и адресам из METRICS_ALLOWED_NETWORKS (сеть, из которой
+# обращается Prometheus), снаружи он дополнительно закрыт в nginx.
+# При нескольких процессах метрики собираются через каталог PROMETHEUS_MULTIPROC_DIR (см. config.metrics)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED') == 'True'
+METRICS_ALLOWED_NETWORKS = os.getenv('METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128').split(',')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'config.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Размер страницы курсорной пагинации привычек (?pagination=cursor&page_size=...)
+HABITS_CURSOR_PAGE_SIZE = 20
+HABITS_CURSOR_MAX_PAGE_SIZE = 100
+# Время жизни закэшированных страниц публичных привычек (сек.)
+HABITS_PUBLIC_CACHE_TIMEOUT = 300
+# Максимальное число привычек в пакетных запросах (/habits/bulk/, /habits/batch/)
+HABITS_BULK_MAX_SIZE = 500
+# Размер порций при выгрузке (/habits/export/) и загрузке (/habits/import/) привычек
+HABITS_EXPORT_CHUNK_SIZE = 2000
+HABITS_IMPORT_BATCH_SIZE = 1000
+
+# Размер страницы курсорной пагинации списка пользователей
+USERS_CURSOR_PAGE_SIZE = 50
+USERS_CURSOR_MAX_PAGE_SIZE = 500
+# Размер порции, которой читаются из БД пользователи при выгрузке (/users/export/)
+USERS_EXPORT_CHUNK_SIZE = 2000
+
+# Уменьшенные копии аватаров (сторона квадрата в пикселях), их создаёт задача users.tasks.process_avatar.
+# В ответах API поле avatar - копия AVATAR_DEFAULT_THUMBNAIL в WebP, все копии - в avatar_thumbnails
+AVATAR_THUMBNAIL_SIZES = {'small': 64, 'medium': 256}
+AVATAR_DEFAULT_THUMBNAIL = 'small'
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
+# Кэш пользователей для JWT-аутентификации: в памяти процесса (LRU) и в общем кэше
+AUTH_USER_LOCAL_CACHE_SIZE = 1024
+# Время жизни записей в памяти процесса (сек.) - столько другие процессы
+# могут видеть пользователя устаревшим после его изменения или блокировки
+AUTH_USER_LOCAL_CACHE_TTL = int(os.getenv('AUTH_USER_LOCAL_CACHE_TTL', 5))
+AUTH_USER_CACHE_TIMEOUT = 300
+# Читающие запросы к view со stateless_auth = True получают пользователя
+# только из токена (TokenUser), без обращения к кэшу и БД
+AUTH_STATELESS_SAFE_METHODS = os.getenv('AUTH_STATELESS_SAFE_METHODS') == 'True'
+
 # URL-адрес брокера сообщений redis
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
 
@@ -174,8 +297,32 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'habits.tasks.send_tg_message',  # Путь к задаче
         'schedule': timedelta(minutes=1),  # Расписание выполнения задачи (например, каждую 1 минуту)
     },
+    'requeue_stale_deliveries': {
+        'task': 'habits.tasks.requeue_stale_deliveries',
+        'schedule': timedelta(minutes=1),
+    },
 }
 
+# За сколько до начала привычки отправляется напоминание
+TG_REMINDER_LEAD_TIME = timedelta(minutes=10)
+
+# Очередь для рассылки напоминаний в Telegram. Её обслуживает отдельный воркер
+# с пулом eventlet (см. сервис celery-notifications в docker-compose.yml):
+# celery -A config worker -Q notifications -P eventlet -c <TG_NOTIFICATIONS_CONCURRENCY>
+TG_NOTIFICATIONS_QUEUE = os.getenv('TG_NOTIFICATIONS_QUEUE', 'notifications')
+TG_NOTIFICATIONS_CONCURRENCY = int(os.getenv('TG_NOTIFICATIONS_CONCURRENCY', 100))
+
+CELERY_TASK_ROUTES = {
+    'habits.tasks.send_tg_message_chunk': {'queue': TG_NOTIFICATIONS_QUEUE},
+    'habits.tasks.retry_reminder_deliveries': {'queue': TG_NOTIFICATIONS_QUEUE},
+}
+
+# Индекс расписания привычек в Redis (sorted set id -> время начала).
+# Если адрес не задан, задача рассылки ищет привычки в БД.
+# После включения индекс заполняется командой: python manage.py rebuild_schedule_index
+HABIT_SCHEDULE_INDEX_URL = os.getenv('HABIT_SCHEDULE_INDEX_URL')
+HABIT_SCHEDULE_INDEX_KEY = 'habits:schedule'
+
 # Замените на адрес вашего фронтенд-сервера
 CORS_ALLOWED_ORIGINS = [
     os.getenv('CORS_ALLOWED_ORIGINS'),
@@ -196,3 +343,24 @@ SWAGGER_SETTINGS = {
 
 TG_BOT_API_KEY = os.getenv('TG_BOT_API_KEY')
 TG_CHAT_ID = os.getenv('TG_CHAT_ID')
+
+# адрес Telegram Bot API (в тестах можно подменить локальным сервером)
+TG_API_URL = os.getenv('TG_API_URL', 'https://api.telegram.org')
+# число одновременных запросов и таймаут (сек.) при рассылке напоминаний
+TG_DISPATCH_CONCURRENCY = int(os.getenv('TG_DISPATCH_CONCURRENCY', 16))
+TG_DISPATCH_TIMEOUT = float(os.getenv('TG_DISPATCH_TIMEOUT', 10))
+# размер порции, которой читаются из БД привычки для рассылки
+TG_REMINDER_FETCH_SIZE = int(os.getenv('TG_REMINDER_FETCH_SIZE', 2000))
+# количество напоминаний в одной подзадаче рассылки
+TG_REMINDER_CHUNK_SIZE = int(os.getenv('TG_REMINDER_CHUNK_SIZE', 200))
+# повторы недоставленных напоминаний: число попыток и задержка перед повтором (сек.),
+# удваивающаяся с каждой попыткой, но не больше TG_REMINDER_RETRY_MAX_DELAY
+TG_REMINDER_MAX_ATTEMPTS = int(os.getenv('TG_REMINDER_MAX_ATTEMPTS', 5))
+TG_REMINDER_RETRY_DELAY = int(os.getenv('TG_REMINDER_RETRY_DELAY', 30))
+TG_REMINDER_RETRY_MAX_DELAY = int(os.getenv('TG_REMINDER_RETRY_MAX_DELAY', 600))
+# через сколько секунд без смены статуса доставка считается зависшей и ставится в очередь снова
+# (requeue_stale_deliveries); должно быть заметно больше времени отправки одной подзадачи
+TG_REMINDER_STALE_TIMEOUT = int(os.getenv('TG_REMINDER_STALE_TIMEOUT', 300))
+# одно сообщение-сводка на чат за запуск рассылки вместо сообщения на каждую привычку:
+# число запросов к Telegram растёт с числом чатов, а не привычек (лимиты Telegram на чат)
+TG_REMINDER_DIGEST = os.getenv('TG_REMINDER_DIGEST') == 'True'
@@ -0,0 +1,125 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+# замеры текущего запроса; None вне collect_timings() (middleware замеров выключены)
+current_timings = ContextVar('current_timings', default=None)
+
+# литералы, которые не должны различать "одинаковые" запросы
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class RequestTimings:
+    """
+    Замеры одного запроса: время по этапам (мс), число SQL-запросов и, если track_shapes,
+    запросы, сгруппированные по виду (нужны только Server-Timing для поиска N+1:
+    нормализация текста каждого запроса регулярным выражением не бесплатна).
+    """
+
+    def __init__(self, track_shapes=True):
+        self.durations = Counter()
+        self.queries = 0
+        self.shapes = Counter()
+        self.track_shapes = track_shapes
+
+    def add(self, name, started):
+        self.durations[name] += (time.perf_counter() - started) * 1000
+
+    def execute(self, execute, sql, params, many, context):
+        """ Обёртка выполнения SQL для connection.execute_wrapper """
+
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add_query(sql, started)
+
+    def add_query(self, sql, started):
+        self.add('db', started)
+        self.queries += 1
+        if self.track_shapes:
+            self.shapes[SQL_LITERALS.sub('?', sql)] += 1
+
+    def snapshot(self):
+        """ Число запросов и время в БД на текущий момент - для замеров части запроса """
+
+        return self.queries, self.durations['db']
+
+    def repeated_queries(self, threshold):
+        """ Виды запросов, выполненные не меньше threshold раз (признак N+1) """
+
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+@contextmanager
+def collect_timings(track_shapes=False):
+    """
+    Замеры текущего запроса: SQL-запросы всех подключений и этапы, отмеченные timer().
+    Вложенные вызовы (несколько middleware) получают те же замеры;
+    виды запросов собираются, если их запросил хотя бы один из вызовов.
+    """
+
+    timings = current_timings.get()
+    if timings is not None:
+        timings.track_shapes = timings.track_shapes or track_shapes
+        yield timings
+        return
+
+    timings = RequestTimings(track_shapes)
+    token = current_timings.set(timings)
+    try:
+        with ExitStack() as stack:
+            wrap_connections(stack, timings)
+            yield timings
+    finally:
+        current_timings.reset(token)
+
+
+@asynccontextmanager
+async def acollect_timings(track_shapes=False):
+    """
+    collect_timings() для асинхронных view и middleware. Асинхронный ORM выполняет запросы
+    через sync_to_async в отдельном потоке запроса со своими подключениями,
+    поэтому замер SQL подключается к ним в этом же потоке.
+    """
+
+    timings = current_timings.get()
+    if timings is not None:
+        timings.track_shapes = timings.track_shapes or track_shapes
+        yield timings
+        return
+
+    timings = RequestTimings(track_shapes)
+    token = current_timings.set(timings)
+    stack = ExitStack()
+    try:
+        await sync_to_async(wrap_connections)(stack, timings)
+        yield timings
+    finally:
+        await sync_to_async(stack.close)()
+        current_timings.reset(token)
+
+
+def wrap_connections(stack, timings):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timings.execute))
+
+
+@contextmanager
+def timer(name):
+    """ Добавляет время выполнения блока к этапу name текущего запроса, если замеры включены """
+
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, started)
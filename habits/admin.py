@@ -1,5 +1,14 @@
 from django.contrib import admin
 
-from habits.models import Habit
+from habits.models import Habit, ReminderDelivery, SchedulerWatermark
 
 admin.site.register(Habit)
+admin.site.register(SchedulerWatermark)
+
+
+@admin.register(ReminderDelivery)
+class ReminderDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('habit', 'occurrence_time', 'chat_id', 'status', 'attempts', 'sent_at')
+    list_filter = ('status',)
+    raw_id_fields = ('habit',)
+    date_hierarchy = 'occurrence_time'
@@ -0,0 +1,105 @@
+"""
+Асинхронные (ASGI) версии чтения привычек: список и детальная привычка.
+
+Пока view ждёт БД или кэш, процесс обслуживает другие запросы, поэтому медленные клиенты
+и ожидание ввода-вывода не занимают воркер целиком, как синхронные view под WSGI.
+Это простые view Django без DRF (DRF не поддерживает асинхронные view): аутентификация -
+CachedJWTAuthentication.aauthenticate, запросы к БД - асинхронный ORM (aiterator, afirst).
+Под WSGI они тоже работают, но каждый запрос выполняется в отдельном цикле событий.
+"""
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound, ValidationError
+
+from config.renderers import ORJSONRenderer
+from habits.models import Habit
+from habits.serializers import HabitSerializer
+from users.authentication import CachedJWTAuthentication
+
+renderer = ORJSONRenderer()
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(renderer.render(data), status=status_code, content_type=renderer.media_type)
+
+
+def render_error(exc):
+    detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    response = render(detail, exc.status_code)
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        response['WWW-Authenticate'] = CachedJWTAuthentication().authenticate_header(None)
+    return response
+
+
+def api_view(view):
+    """
+    Асинхронный view только для GET: аутентифицирует пользователя (только собственные
+    и публичные привычки, поэтому достаточно TokenUser) и превращает ошибки API в ответ JSON.
+    """
+
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = render({'detail': f'Метод "{request.method}" не разрешен.'},
+                              status.HTTP_405_METHOD_NOT_ALLOWED)
+            response['Allow'] = 'GET, HEAD'
+            return response
+        try:
+            auth = await CachedJWTAuthentication().aauthenticate(request, stateless_auth=True)
+            if auth is None:
+                raise NotAuthenticated
+            request.user, request.auth = auth
+            return render(await view(request, *args, **kwargs))
+        except APIException as exc:
+            return render_error(exc)
+
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper
+
+
+def get_int_param(request, name, default=None):
+    value = request.GET.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: ['Ожидается целое число.']})
+
+
+@api_view
+async def habit_list(request):
+    """
+    Собственные и публичные привычки, страницами по id: ?after=<последний id>&page_size=...
+    (как курсорная пагинация синхронного списка, без подсчёта количества).
+    """
+
+    after = get_int_param(request, 'after')
+    page_size = get_int_param(request, 'page_size', settings.HABITS_CURSOR_PAGE_SIZE)
+    page_size = max(1, min(page_size, settings.HABITS_CURSOR_MAX_PAGE_SIZE))
+
+    habits = Habit.objects.filter(Q(owner_id=request.user.pk) | Q(is_public=True)).order_by('id')
+    if after is not None:
+        habits = habits.filter(id__gt=after)
+    page = [habit async for habit in habits[:page_size + 1].aiterator(chunk_size=page_size + 1)]
+
+    next_link = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        query = {**request.GET.dict(), 'after': page[-1].pk}
+        next_link = request.build_absolute_uri(f'{request.path}?{urlencode(query)}')
+    return {'next': next_link, 'results': HabitSerializer(page, many=True).data}
+
+
+@api_view
+async def habit_retrieve(request, pk):
+    """ Собственная привычка; чужие и несуществующие - 404 """
+
+    habit = await Habit.objects.filter(owner_id=request.user.pk, pk=pk).afirst()
+    if habit is None:
+        raise NotFound
+    return HabitSerializer(habit).data
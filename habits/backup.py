@@ -0,0 +1,152 @@
+import orjson
+from django.conf import settings
+from django.db import transaction
+from django.utils.duration import duration_string
+from rest_framework.exceptions import ValidationError
+
+from config.export import ndjson_lines
+from habits.cache import bump_public_version
+from habits.models import Habit
+from habits.schedule import index_habits
+from habits.serializers import HabitSerializer
+
+BACKUP_FIELDS = ('id', 'place', 'start_time', 'action', 'is_nice', 'related_to',
+                 'interval', 'reward', 'duration', 'is_public')
+LINK_BATCH_SIZE = 100
+
+
+def export_habits(owner_id):
+    """
+    Строки NDJSON со всеми привычками пользователя owner_id.
+    Привычки читаются порциями (на PostgreSQL - через серверный курсор),
+    поэтому память не зависит от их количества.
+    """
+
+    rows = (
+        Habit.objects.filter(owner_id=owner_id).order_by('id')
+        .values_list(*(field if field != 'related_to' else 'related_to_id' for field in BACKUP_FIELDS))
+        .iterator(chunk_size=settings.HABITS_EXPORT_CHUNK_SIZE)
+    )
+    duration_index = BACKUP_FIELDS.index('duration')
+    rows = ((*row[:duration_index], duration_string(row[duration_index]), *row[duration_index + 1:]) for row in rows)
+    return ndjson_lines(BACKUP_FIELDS, rows)
+
+
+class HabitImporter:
+    """
+    Загрузка привычек пользователя из NDJSON (формат export_habits) в одной транзакции.
+
+    Строки читаются по одной и сохраняются пачками по batch_size через bulk_create.
+    id из файла не сохраняются: в памяти остаётся только соответствие старых id новым.
+    Ссылки related_to на уже сохранённые привычки проставляются при вставке,
+    ссылки вперёд (на привычки из следующих пачек) - вторым проходом.
+    При любой ошибке ничего не сохраняется, ошибка содержит номер строки.
+    """
+
+    def __init__(self, owner, batch_size=None):
+        self.owner = owner
+        self.batch_size = batch_size or settings.HABITS_IMPORT_BATCH_SIZE
+        # один сериализатор на все строки: построение его полей дороже самой проверки
+        self.serializer = HabitSerializer()
+        self.id_map = {}
+        self.nice_ids = set()
+        self.links = []
+        self.created = 0
+        self.linked = 0
+
+    def parse(self, number, line):
+        try:
+            item = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            raise ValidationError({'line': number, 'errors': ['Некорректный JSON.']})
+        if not isinstance(item, dict):
+            raise ValidationError({'line': number, 'errors': ['Ожидается объект привычки.']})
+
+        old_id = item.pop('id', None)
+        related_to = item.pop('related_to', None)
+        if not all(value is None or isinstance(value, int) for value in (old_id, related_to)):
+            raise ValidationError({'line': number, 'errors': ['id и related_to должны быть целыми числами.']})
+        try:
+            data = self.serializer.run_validation(item)
+        except ValidationError as exc:
+            raise ValidationError({'line': number, 'errors': exc.detail})
+        if related_to is not None and (data.get('reward') or data.get('is_nice')):
+            raise ValidationError({'line': number, 'errors': [
+                'У приятной привычки и привычки с вознаграждением не может быть связанной привычки.'
+            ]})
+        return old_id, related_to, Habit(**data, owner=self.owner)
+
+    def get_related_id(self, related_to, number):
+        related_id = self.id_map[related_to]
+        if related_id not in self.nice_ids:
+            raise ValidationError({'line': number, 'errors': [
+                'В связанные привычки могут попадать только привычки с признаком приятной привычки.'
+            ]})
+        return related_id
+
+    def insert(self, batch):
+        if not batch:
+            return
+        for old_id, related_to, habit, number in batch:
+            habit.set_interval_days()
+            if related_to in self.id_map:
+                habit.related_to_id = self.get_related_id(related_to, number)
+                self.linked += 1
+        habits = [habit for _, _, habit, _ in batch]
+        Habit.objects.bulk_create(habits)
+        for old_id, related_to, habit, number in batch:
+            if old_id is not None:
+                self.id_map[old_id] = habit.pk
+            if habit.is_nice:
+                self.nice_ids.add(habit.pk)
+        items = [(habit.pk, habit.start_time) for habit in habits]
+        transaction.on_commit(lambda: index_habits(items))
+        self.created += len(habits)
+
+    def save_batch(self, batch):
+        """
+        Сохраняет пачку в два INSERT: сначала привычки без ссылок или со ссылками на уже
+        сохранённые, затем ссылающиеся на привычки этой же пачки - к этому моменту их id известны.
+        Связанная привычка - приятная и сама ссылок не имеет, поэтому цепочек длиннее одной нет.
+        """
+
+        ready = [row for row in batch if row[1] is None or row[1] in self.id_map]
+        waiting = [row for row in batch if not (row[1] is None or row[1] in self.id_map)]
+        self.insert(ready)
+        self.insert(waiting)
+        for old_id, related_to, habit, number in waiting:
+            if habit.related_to_id is None:
+                self.links.append((habit.pk, related_to, number))
+
+    def link(self):
+        """ Второй проход: ссылки related_to на привычки, которые шли в файле позже """
+
+        habits = []
+        for habit_id, related_to, number in self.links:
+            if related_to not in self.id_map:
+                raise ValidationError({'line': number, 'errors': [
+                    f'Связанная привычка {related_to} отсутствует в файле.'
+                ]})
+            habits.append(Habit(pk=habit_id, related_to_id=self.get_related_id(related_to, number)))
+        # UPDATE ... CASE WHEN проверяет условия по очереди для каждой строки,
+        # поэтому пачки здесь меньше, чем при вставке
+        Habit.objects.bulk_update(habits, ['related_to'], batch_size=LINK_BATCH_SIZE)
+        self.linked += len(habits)
+
+    def run(self, lines):
+        """ Загружает привычки из итерируемого источника строк NDJSON, возвращает итоги """
+
+        with transaction.atomic():
+            batch = []
+            for number, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                old_id, related_to, habit = self.parse(number, line)
+                batch.append((old_id, related_to, habit, number))
+                if len(batch) == self.batch_size:
+                    self.save_batch(batch)
+                    batch = []
+            self.save_batch(batch)
+            self.link()
+            transaction.on_commit(bump_public_version)
+        return {'created': self.created, 'linked': self.linked}
@@ -0,0 +1,79 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from config.metrics import CACHE_REQUESTS
+from habits.models import Habit
+from habits.serializers import HabitSerializer
+
+PUBLIC_VERSION_KEY = 'habits:public:version'
+PUBLIC_STATS_KEYS = {'hits': 'habits:public:hits', 'misses': 'habits:public:misses'}
+
+
+def is_cache_shared():
+    """
+    Общий ли кэш для всех процессов. Без CACHE_URL кэш в памяти процесса: версия,
+    изменённая другим воркером или задачей Celery, до этого процесса не доходит.
+    """
+
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_public_version():
+    """ Текущая версия кэша публичных привычек """
+
+    version = cache.get(PUBLIC_VERSION_KEY)
+    if version is None:
+        # версия из текущего времени не совпадёт ни с одной из прежних,
+        # даже если ключ версии был вытеснен из кэша
+        cache.add(PUBLIC_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(PUBLIC_VERSION_KEY)
+    return version
+
+
+def bump_public_version():
+    """ Инвалидирует все закэшированные страницы публичных привычек за O(1) """
+
+    try:
+        cache.incr(PUBLIC_VERSION_KEY)
+    except ValueError:
+        get_public_version()
+
+
+def record(event):
+    CACHE_REQUESTS.labels('public_habits', 'hit' if event == 'hits' else 'miss').inc()
+    try:
+        cache.incr(PUBLIC_STATS_KEYS[event])
+    except ValueError:
+        cache.add(PUBLIC_STATS_KEYS[event], 1, timeout=None)
+
+
+def get_public_page(after, size):
+    """
+    Сериализованные публичные привычки с id > after (не более size) из кэша.
+    Страницы хранятся под ключом с текущей версией, поэтому после изменения
+    привычек старые страницы просто перестают запрашиваться.
+    """
+
+    key = f'habits:public:{get_public_version()}:{after}:{size}'
+    page = cache.get(key)
+    if page is not None:
+        record('hits')
+        return page
+
+    record('misses')
+    habits = Habit.objects.filter(is_public=True)
+    if after is not None:
+        habits = habits.filter(id__gt=after)
+    page = list(HabitSerializer(habits[:size], many=True).data)
+    cache.set(key, page, timeout=settings.HABITS_PUBLIC_CACHE_TIMEOUT)
+    return page
+
+
+def get_cache_stats():
+    """ Счётчики попаданий и промахов кэша публичных привычек """
+
+    return {event: cache.get(key, 0) for event, key in PUBLIC_STATS_KEYS.items()}
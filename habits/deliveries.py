@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from habits.models import ReminderDelivery
+
+
+def claim_deliveries(delivery_ids, status):
+    """
+    Переводит доставки из статуса status в отправку и возвращает их.
+    Доставки, уже взятые другой подзадачей (повторная доставка задачи брокером,
+    пересекающиеся повторы), пропускаются, поэтому одно напоминание не уходит дважды.
+    """
+
+    with transaction.atomic():
+        deliveries = list(
+            ReminderDelivery.objects.select_for_update(skip_locked=True)
+            .filter(id__in=delivery_ids, status=status)
+            .only('id', 'chat_id', 'text', 'occurrence_time', 'attempts')
+        )
+        ReminderDelivery.objects.filter(id__in=[delivery.pk for delivery in deliveries]).update(
+            status=ReminderDelivery.SENDING, attempts=F('attempts') + 1, updated_at=Now()
+        )
+    for delivery in deliveries:
+        delivery.attempts += 1
+    return deliveries
+
+
+def get_retry_delay(attempts):
+    """ Задержка перед повтором после attempts неудачных попыток: экспоненциальная, с ограничением """
+
+    return min(settings.TG_REMINDER_RETRY_DELAY * 2 ** (attempts - 1), settings.TG_REMINDER_RETRY_MAX_DELAY)
+
+
+def mark_deliveries(sent, failed):
+    """
+    Сохраняет итог отправки: отправленные - SENT, неотправленные - RETRYING
+    или FAILED после TG_REMINDER_MAX_ATTEMPTS попыток.
+    Возвращает {задержка повтора: [id доставок]} для постановки повторов.
+    """
+
+    if sent:
+        ReminderDelivery.objects.filter(id__in=[delivery.pk for delivery in sent]).update(
+            status=ReminderDelivery.SENT, sent_at=Now(), updated_at=Now()
+        )
+
+    exhausted = [delivery.pk for delivery in failed if delivery.attempts >= settings.TG_REMINDER_MAX_ATTEMPTS]
+    if exhausted:
+        ReminderDelivery.objects.filter(id__in=exhausted).update(status=ReminderDelivery.FAILED, updated_at=Now())
+
+    retries = {}
+    for delivery in failed:
+        if delivery.attempts < settings.TG_REMINDER_MAX_ATTEMPTS:
+            retries.setdefault(get_retry_delay(delivery.attempts), []).append(delivery.pk)
+    if retries:
+        ReminderDelivery.objects.filter(id__in=[pk for ids in retries.values() for pk in ids]).update(
+            status=ReminderDelivery.RETRYING, updated_at=Now()
+        )
+    return retries
+
+
+def release_stale_deliveries(timeout):
+    """
+    Находит доставки, статус которых не менялся дольше timeout (сек.): ожидающие отправки
+    (подзадача не поставлена в очередь - например, брокер был недоступен), в отправке
+    (воркер завершился между claim_deliveries и mark_deliveries) и ожидающие повтора дольше
+    TG_REMINDER_RETRY_MAX_DELAY (повтор не поставлен). Зависшая отправка считается неудачной
+    попыткой: доставка переводится в повтор или FAILED после TG_REMINDER_MAX_ATTEMPTS.
+    Время изменения найденных доставок обновляется, поэтому до следующего timeout они не находятся снова.
+    Возвращает {PENDING: [(chat_id, id)], RETRYING: [(chat_id, id)]} для постановки подзадач.
+    """
+
+    stale_before = timezone.now() - timedelta(seconds=timeout)
+    retry_before = stale_before - timedelta(seconds=settings.TG_REMINDER_RETRY_MAX_DELAY)
+    stale = Q(status__in=[ReminderDelivery.PENDING, ReminderDelivery.SENDING], updated_at__lt=stale_before)
+    stale |= Q(status=ReminderDelivery.RETRYING, updated_at__lt=retry_before)
+    with transaction.atomic():
+        rows = list(
+            ReminderDelivery.objects.select_for_update(skip_locked=True).filter(stale)
+            .order_by('chat_id', 'id').values_list('chat_id', 'id', 'status', 'attempts')
+        )
+        exhausted = {delivery_id for _, delivery_id, status, attempts in rows
+                     if status == ReminderDelivery.SENDING and attempts >= settings.TG_REMINDER_MAX_ATTEMPTS}
+        released = {ReminderDelivery.PENDING: [], ReminderDelivery.RETRYING: []}
+        for chat_id, delivery_id, status, _ in rows:
+            if delivery_id not in exhausted:
+                status = ReminderDelivery.PENDING if status == ReminderDelivery.PENDING else ReminderDelivery.RETRYING
+                released[status].append((chat_id, delivery_id))
+
+        if exhausted:
+            ReminderDelivery.objects.filter(id__in=exhausted).update(status=ReminderDelivery.FAILED, updated_at=Now())
+        for status, items in released.items():
+            if items:
+                ReminderDelivery.objects.filter(id__in=[delivery_id for _, delivery_id in items]).update(
+                    status=status, updated_at=Now()
+                )
+    return released
+
+
+def get_delivery_stats(since, until=None):
+    """
+    Количество напоминаний по статусам и доля доставленных среди завершённых (SENT и FAILED)
+    для наступлений привычек в интервале [since, until). Один GROUP BY по индексу
+    reminder_delivery_time_idx.
+    """
+
+    deliveries = ReminderDelivery.objects.filter(occurrence_time__gte=since)
+    if until is not None:
+        deliveries = deliveries.filter(occurrence_time__lt=until)
+    counts = dict(deliveries.order_by().values_list('status').annotate(count=Count('id')))
+    stats = {status: counts.get(status, 0) for status, _ in ReminderDelivery.STATUSES}
+    finished = stats[ReminderDelivery.SENT] + stats[ReminderDelivery.FAILED]
+    stats['delivery_rate'] = stats[ReminderDelivery.SENT] / finished if finished else None
+    return stats
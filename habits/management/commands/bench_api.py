@@ -0,0 +1,192 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from habits.models import Habit
+from users.models import User
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Command(BaseCommand):
+    """
+    Замеряет задержку (перцентили) и число запросов к БД основных эндпоинтов API
+    на локальной БД с данными (см. seed_habits). Изменения в БД откатываются; индекс расписания
+    и версия кэша публичных привычек обновляются только после фиксации транзакции,
+    поэтому замеры не оставляют следов и вне БД.
+
+    Результат сохраняется в JSON (--output) для сравнения между коммитами.
+    Пороги (--thresholds) - JSON вида {"habit_list": {"p95_ms": 50, "queries": 3}};
+    с --baseline результат сравнивается с прошлым: p95 не должен вырасти больше
+    чем на --max-regression, число запросов не должно вырасти вообще.
+    При нарушении порогов команда завершается с ошибкой.
+    """
+
+    help = 'Замеряет задержку и число запросов к БД эндпоинтов привычек и пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='количество замеров каждого сценария')
+        parser.add_argument('--warmup', type=int, default=10, help='количество прогревочных запросов')
+        parser.add_argument('--email', help='пользователь для замеров (по умолчанию - владелец приятной привычки)')
+        parser.add_argument('--password', default='seed-password', help='пароль пользователя для получения токена')
+        parser.add_argument('--only', nargs='+', help='выполнить только указанные сценарии')
+        parser.add_argument('--output', help='файл для результата в JSON')
+        parser.add_argument('--thresholds', help='JSON-файл с порогами для сценариев')
+        parser.add_argument('--baseline', help='JSON-файл с прошлым результатом для сравнения')
+        parser.add_argument('--max-regression', type=float, default=0.2,
+                            help='допустимый рост p95 относительно --baseline (доля)')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['email'])
+        own_habit = Habit.objects.filter(owner=user).order_by('id').first()
+        nice_habit = Habit.objects.filter(owner=user, is_nice=True).order_by('id').first()
+        if own_habit is None or nice_habit is None:
+            raise CommandError('У пользователя должны быть привычки, в том числе приятная (см. seed_habits)')
+
+        hosts = [host for host in settings.ALLOWED_HOSTS if host and host != '*' and not host.startswith('.')]
+        client = APIClient(SERVER_NAME=hosts[0] if hosts else 'localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        anonymous = APIClient(SERVER_NAME=hosts[0] if hosts else 'localhost')
+
+        start_time = (timezone.now() + timedelta(days=1)).isoformat()
+        scenarios = {
+            'habit_list': lambda: client.get('/habits/'),
+            'habit_list_cursor': lambda: client.get('/habits/?pagination=cursor'),
+            'habit_retrieve': lambda: client.get(f'/habits/{own_habit.pk}/'),
+            'habit_create_related': lambda: client.post('/habits/', {
+                'place': 'Дом', 'action': 'Замер', 'related_to': nice_habit.pk,
+                'interval': 'ежедневно', 'start_time': start_time,
+            }, format='json'),
+            'token_obtain': lambda: anonymous.post('/users/token/', {
+                'email': user.email, 'password': options['password'],
+            }, format='json'),
+            'user_retrieve': lambda: client.get(f'/users/{user.pk}/'),
+        }
+        if options['only']:
+            unknown = set(options['only']) - set(scenarios)
+            if unknown:
+                raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+            scenarios = {name: scenarios[name] for name in options['only']}
+
+        results = {}
+        with transaction.atomic():
+            for name, request in scenarios.items():
+                results[name] = self.measure(name, request, options['requests'], options['warmup'])
+            transaction.set_rollback(True)
+
+        report = {'meta': self.get_meta(user, options), 'results': results}
+        self.print_report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, ensure_ascii=False)
+
+        violations = self.get_violations(results, options)
+        if violations:
+            raise CommandError('Пороги производительности нарушены:\n' + '\n'.join(violations))
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.filter(habit__is_nice=True).order_by('id').first()
+        if user is None:
+            raise CommandError('Пользователь для замеров не найден: заполните БД командой seed_habits')
+        return user
+
+    def measure(self, name, request, count, warmup):
+        for _ in range(warmup):
+            self.check_response(name, request())
+
+        timings = []
+        queries = []
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.check_response(name, response)
+            queries.append(len(context))
+
+        timings.sort()
+        result = {f'p{percentile}_ms': round(self.percentile(timings, percentile), 3) for percentile in PERCENTILES}
+        result.update({
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'max_ms': round(timings[-1], 3),
+            'queries': max(queries),
+            'requests': count,
+        })
+        return result
+
+    @staticmethod
+    def percentile(values, percentile):
+        """ Перцентиль отсортированного списка (метод ближайшего ранга) """
+
+        index = max(0, -(-len(values) * percentile // 100) - 1)
+        return values[int(index)]
+
+    @staticmethod
+    def check_response(name, response):
+        if response.status_code >= 400:
+            raise CommandError(f'{name}: ответ {response.status_code} {getattr(response, "data", "")}')
+
+    @staticmethod
+    def get_meta(user, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                    text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'users': User.objects.count(),
+            'habits': Habit.objects.count(),
+            'user_habits': Habit.objects.filter(owner=user).count(),
+            'requests': options['requests'],
+        }
+
+    def print_report(self, results):
+        header = f'{"сценарий":<24}' + ''.join(f'{f"p{percentile}, мс":>12}' for percentile in PERCENTILES)
+        self.stdout.write(header + f'{"запросов":>10}')
+        for name, result in results.items():
+            line = f'{name:<24}' + ''.join(f'{result[f"p{percentile}_ms"]:>12.2f}' for percentile in PERCENTILES)
+            self.stdout.write(line + f'{result["queries"]:>10}')
+
+    @staticmethod
+    def get_violations(results, options):
+        violations = []
+        if options['thresholds']:
+            with open(options['thresholds']) as file:
+                thresholds = json.load(file)
+            for name, limits in thresholds.items():
+                for metric, limit in limits.items():
+                    value = results.get(name, {}).get(metric)
+                    if value is not None and value > limit:
+                        violations.append(f'{name}: {metric} = {value} > {limit}')
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)['results']
+            for name, result in results.items():
+                previous = baseline.get(name)
+                if previous is None:
+                    continue
+                if result['queries'] > previous['queries']:
+                    violations.append(f'{name}: запросов {result["queries"]}, было {previous["queries"]}')
+                limit = previous['p95_ms'] * (1 + options['max_regression'])
+                if result['p95_ms'] > limit:
+                    violations.append(f'{name}: p95 {result["p95_ms"]} мс, было {previous["p95_ms"]} мс')
+        return violations
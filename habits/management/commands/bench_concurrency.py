@@ -0,0 +1,109 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management import BaseCommand, CommandError
+from requests.adapters import HTTPAdapter
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from habits.management.commands.bench_api import PERCENTILES, Command as BenchAPICommand
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Пропускная способность запущенного сервера при N одновременных соединениях:
+    каждое соединение отправляет запросы друг за другом в течение --duration секунд.
+    Предназначена для сравнения WSGI- и ASGI-развёртывания на одних и тех же данных, например:
+
+        gunicorn config.wsgi -w 4 -b 127.0.0.1:8000
+        gunicorn config.asgi -w 4 -k uvicorn.workers.UvicornWorker -b 127.0.0.1:8001
+        python manage.py bench_concurrency \\
+            --target wsgi=http://127.0.0.1:8000/habits/?pagination=cursor \\
+            --target asgi=http://127.0.0.1:8001/async/habits/ --concurrency 1 16 64 256
+
+    Под WSGI одновременно обрабатывается не больше запросов, чем потоков во всех воркерах,
+    остальные соединения ждут в очереди; под ASGI воркер продолжает принимать запросы,
+    пока другие ждут БД и кэш.
+    """
+
+    help = 'Сравнивает пропускную способность серверов (WSGI/ASGI) при одновременных соединениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='имя=URL проверяемого эндпоинта, можно указать несколько раз')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64],
+                            help='количество одновременных соединений')
+        parser.add_argument('--duration', type=float, default=10, help='длительность замера (сек.)')
+        parser.add_argument('--timeout', type=float, default=30, help='таймаут запроса (сек.)')
+        parser.add_argument('--email', help='пользователь, от имени которого отправляются запросы')
+        parser.add_argument('--output', help='файл для результата в JSON')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, separator, url = target.partition('=')
+            if not separator or not url:
+                raise CommandError(f'Ожидается имя=URL: {target}')
+            targets.append((name, url))
+
+        user = BenchAPICommand().get_user(options['email'])
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+        results = {}
+        for name, url in targets:
+            results[name] = {}
+            for concurrency in options['concurrency']:
+                result = self.measure(url, headers, concurrency, options['duration'], options['timeout'])
+                results[name][concurrency] = result
+                latency = '  '.join(f'p{percentile} {result[f"p{percentile}_ms"]:.1f} мс' for percentile in PERCENTILES)
+                self.stdout.write(f'{name:<10}{concurrency:>6} соед. {result["rps"]:>10.1f} запр./с  '
+                                  f'{latency}  ошибок {result["errors"]}')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'users': User.objects.count(), 'results': results}, output, indent=2)
+
+    def measure(self, url, headers, concurrency, duration, timeout):
+        deadline = time.monotonic() + duration
+        lock = threading.Lock()
+        timings = []
+        errors = []
+
+        def worker():
+            # у каждого потока своё keep-alive соединение
+            with requests.Session() as session:
+                session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        response = session.get(url, headers=headers, timeout=timeout)
+                        failed = response.status_code >= 400
+                    except requests.RequestException:
+                        failed = True
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        (errors if failed else timings).append(elapsed)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(worker) for _ in range(concurrency)]:
+                future.result()
+        elapsed = time.monotonic() - started
+
+        if not timings:
+            raise CommandError(f'{url}: ни одного успешного ответа')
+        timings.sort()
+        result = {f'p{percentile}_ms': round(BenchAPICommand.percentile(timings, percentile), 3)
+                  for percentile in PERCENTILES}
+        result.update({
+            'rps': round(len(timings) / elapsed, 1),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'requests': len(timings),
+            'errors': len(errors),
+        })
+        return result
@@ -0,0 +1,43 @@
+import gzip
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from config.renderers import MessagePackRenderer, ORJSONRenderer
+from habits.models import Habit
+from habits.serializers import HabitSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время рендеринга и размер ответа со списком привычек в разных форматах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--habits', type=int, default=1000, help='количество привычек в ответе')
+        parser.add_argument('--repeat', type=int, default=20, help='количество повторов замера')
+
+    def handle(self, *args, **options):
+        count = options['habits']
+        repeat = options['repeat']
+        start_time = datetime(2024, 1, 18, 8, 0, tzinfo=timezone.utc)
+        habits = [
+            Habit(id=number, place='Дом', action=f'Привычка {number}', reward='отдых', is_public=bool(number % 2),
+                  start_time=start_time + timedelta(minutes=number))
+            for number in range(1, count + 1)
+        ]
+        data = {'count': count, 'next': None, 'previous': None,
+                'results': HabitSerializer(habits, many=True).data}
+
+        renderers = {
+            'json (DRF)': JSONRenderer(),
+            'json (orjson)': ORJSONRenderer(),
+            'msgpack': MessagePackRenderer(),
+        }
+        self.stdout.write(f'{"формат":<15}{"мс":>10}{"байт":>12}{"байт gzip":>12}')
+        for name, renderer in renderers.items():
+            started = time.perf_counter()
+            for _ in range(repeat):
+                content = renderer.render(data)
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            self.stdout.write(f'{name:<15}{elapsed:>10.2f}{len(content):>12}{len(gzip.compress(content)):>12}')
@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from habits.backup import export_habits
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выгружает привычки пользователя в NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='почта пользователя')
+        parser.add_argument('--output', help='файл для выгрузки (по умолчанию stdout)')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first()
+        if user is None:
+            raise CommandError(f'Пользователь {options["email"]} не найден')
+
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                output.writelines(export_habits(user.pk))
+        else:
+            # бинарный вывод в обход self.stdout, который работает со строками
+            stdout = getattr(self.stdout, 'buffer', None) or sys.stdout.buffer
+            stdout.writelines(export_habits(user.pk))
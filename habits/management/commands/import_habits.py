@@ -0,0 +1,38 @@
+import sys
+import time
+
+from django.core.management import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from habits.backup import HabitImporter
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Загружает привычки пользователя из NDJSON (формат export_habits)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='почта пользователя')
+        parser.add_argument('path', help='файл NDJSON или "-" для stdin')
+        parser.add_argument('--batch-size', type=int, help='количество привычек в одном INSERT')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first()
+        if user is None:
+            raise CommandError(f'Пользователь {options["email"]} не найден')
+
+        importer = HabitImporter(user, batch_size=options['batch_size'])
+        started = time.monotonic()
+        try:
+            if options['path'] == '-':
+                result = importer.run(sys.stdin.buffer)
+            else:
+                with open(options['path'], 'rb') as lines:
+                    result = importer.run(lines)
+        except ValidationError as exc:
+            raise CommandError(f'Привычки не загружены: {exc.detail}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено привычек: {result["created"]}, связей: {result["linked"]} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand, CommandError
+
+from habits.schedule import get_schedule_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает индекс расписания привычек в Redis или сверяет его с БД (--check)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='только сверить индекс с БД')
+
+    def handle(self, *args, **options):
+        index = get_schedule_index()
+        if index is None:
+            raise CommandError('Индекс расписания не включён: задайте HABIT_SCHEDULE_INDEX_URL')
+
+        if not options['check']:
+            count = index.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Индекс расписания перестроен: {count} привычек'))
+            return
+
+        report = index.check()
+        for problem, habit_ids in report.items():
+            if habit_ids:
+                self.stdout.write(f'{problem}: {len(habit_ids)} ({", ".join(map(str, habit_ids[:20]))})')
+        if any(report.values()):
+            raise CommandError('Индекс расписания не совпадает с БД')
+        self.stdout.write(self.style.SUCCESS('Индекс расписания совпадает с БД'))
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+INTERVAL_DAYS = {
+    'ежедневно': 1,
+    'раз в 2 дня': 2,
+    'раз в 3 дня': 3,
+    'еженедельно': 7,
+}
+
+
+def fill_interval_days(apps, schema_editor):
+    Habit = apps.get_model('habits', 'Habit')
+    for interval, days in INTERVAL_DAYS.items():
+        Habit.objects.filter(interval=interval).update(interval_days=days)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0009_alter_habit_interval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='interval_days',
+            field=models.PositiveSmallIntegerField(default=1, editable=False, verbose_name='периодичность в днях'),
+        ),
+        migrations.RunPython(fill_interval_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0010_habit_interval_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='задача')),
+                ('value', models.DateTimeField(verbose_name='обработано до')),
+            ],
+            options={
+                'verbose_name': 'отметка планировщика',
+                'verbose_name_plural': 'отметки планировщика',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0013_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occurrence_time', models.DateTimeField(verbose_name='время начала')),
+                ('chat_id', models.CharField(max_length=20, verbose_name='чат')),
+                ('text', models.TextField(verbose_name='текст')),
+                ('status', models.CharField(choices=[('pending', 'ожидает отправки'), ('sending', 'отправляется'), ('sent', 'отправлено'), ('retrying', 'ожидает повтора'), ('failed', 'не доставлено')], default='pending', max_length=10, verbose_name='статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='попыток')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='отправлено')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='habits.habit', verbose_name='привычка')),
+            ],
+            options={
+                'verbose_name': 'доставка напоминания',
+                'verbose_name_plural': 'доставки напоминаний',
+                'indexes': [models.Index(fields=['occurrence_time', 'status'], name='reminder_delivery_time_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reminderdelivery',
+            constraint=models.UniqueConstraint(fields=('habit', 'occurrence_time'), name='reminder_delivery_occurrence_uniq'),
+        ),
+    ]
@@ -15,6 +15,14 @@ INTERVAL_TYPES = (
     ('еженедельно', 'еженедельно'),
 )
 
+# периодичность в днях для каждого из INTERVAL_TYPES
+INTERVAL_DAYS = {
+    'ежедневно': 1,
+    'раз в 2 дня': 2,
+    'раз в 3 дня': 3,
+    'еженедельно': 7,
+}
+
 
 class Habit(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='создатель', **NULLABLE)
@@ -25,15 +33,106 @@ class Habit(models.Model):
     related_to = models.ForeignKey('self', on_delete=models.CASCADE, verbose_name='связанная с другой', **NULLABLE)
     interval = models.CharField(default='ежедневно', max_length=50,
                                 choices=INTERVAL_TYPES, verbose_name='периодичность')
+    interval_days = models.PositiveSmallIntegerField(default=1, editable=False,
+                                                     verbose_name='периодичность в днях')
     reward = models.CharField(max_length=300, verbose_name='вознаграждение', **NULLABLE)
     duration = models.DurationField(default=timedelta(seconds=120), validators=[validate_duration],
                                     verbose_name='продолжительность')
     is_public = models.BooleanField(default=False, verbose_name='публичная')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='изменена')
 
     def __str__(self):
         return self.action
 
+    def set_interval_days(self):
+        # interval_days всегда соответствует interval, по нему задача рассылки
+        # переносит start_time одним UPDATE для всех привычек.
+        # bulk_create/bulk_update не вызывают save(), поэтому там метод вызывается явно
+        self.interval_days = INTERVAL_DAYS.get(self.interval, 1)
+
+    def save(self, *args, **kwargs):
+        self.set_interval_days()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'interval' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'interval_days'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'привычка'
         verbose_name_plural = 'привычки'
         ordering = ('id',)
+        indexes = [
+            # список привычек: собственные (owner_id, id) или публичные (частичный индекс по id)
+            models.Index(fields=['owner', 'id'], name='habit_owner_id_idx'),
+            models.Index(fields=['id'], condition=models.Q(is_public=True), name='habit_public_id_idx'),
+            # поиск привычек для рассылки напоминаний
+            models.Index(fields=['start_time'], name='habit_start_time_idx'),
+        ]
+
+
+class SchedulerWatermark(models.Model):
+    """
+    Отметка, до которой периодическая задача уже обработала расписание привычек.
+    Следующий запуск задачи продолжает с этой отметки, поэтому интервалы
+    соседних запусков не пересекаются и не оставляют пропусков.
+    """
+
+    name = models.CharField(max_length=50, unique=True, verbose_name='задача')
+    value = models.DateTimeField(verbose_name='обработано до')
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
+    class Meta:
+        verbose_name = 'отметка планировщика'
+        verbose_name_plural = 'отметки планировщика'
+
+
+class ReminderDelivery(models.Model):
+    """
+    Напоминание об одном наступлении привычки (habit, occurrence_time) и его доставка.
+    Уникальность пары делает рассылку идемпотентной: повторная запись того же наступления
+    игнорируется, а отправляется только запись, которую подзадача перевела из ожидания в отправку.
+    """
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    RETRYING = 'retrying'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'ожидает отправки'),
+        (SENDING, 'отправляется'),
+        (SENT, 'отправлено'),
+        (RETRYING, 'ожидает повтора'),
+        (FAILED, 'не доставлено'),
+    )
+
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, verbose_name='привычка')
+    occurrence_time = models.DateTimeField(verbose_name='время начала')
+    chat_id = models.CharField(max_length=20, verbose_name='чат')
+    text = models.TextField(verbose_name='текст')
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING, verbose_name='статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='попыток')
+    sent_at = models.DateTimeField(verbose_name='отправлено', **NULLABLE)
+    # время последней смены статуса: по нему находятся зависшие доставки (requeue_stale_deliveries)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='изменено')
+
+    def __str__(self):
+        return f'{self.habit_id} {self.occurrence_time}: {self.status}'
+
+    class Meta:
+        verbose_name = 'доставка напоминания'
+        verbose_name_plural = 'доставки напоминаний'
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'occurrence_time'], name='reminder_delivery_occurrence_uniq'),
+        ]
+        indexes = [
+            # напоминания интервала рассылки и доля доставленных за период (get_delivery_stats)
+            # читаются только из индекса
+            models.Index(fields=['occurrence_time', 'status'], name='reminder_delivery_time_idx'),
+            # незавершённые доставки по времени смены статуса; завершённые (большая часть журнала)
+            # в частичный индекс не входят
+            models.Index(fields=['updated_at'], name='reminder_delivery_stale_idx',
+                         condition=models.Q(status__in=['pending', 'sending', 'retrying'])),
+        ]
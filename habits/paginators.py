@@ -1,5 +1,66 @@
-from rest_framework.pagination import PageNumberPagination
+import heapq
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
 
 class HabitPaginator(PageNumberPagination):
     page_size = 5
+
+
+class HabitCursorPaginator(CursorPagination):
+    """
+    Курсорная пагинация по id (включается параметром ?pagination=cursor).
+    Стоимость запроса не зависит от глубины страницы, общее количество
+    привычек считается только по явному запросу (?count=true).
+    """
+
+    ordering = 'id'
+    page_size = settings.HABITS_CURSOR_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.HABITS_CURSOR_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = queryset.count() if request.query_params.get('count') == 'true' else None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+    def paginate_feed(self, get_own_page, get_public_page, request):
+        """
+        Страница ленты из двух источников, слитых по id: get_own_page и get_public_page
+        возвращают сериализованные привычки с id > after (не более size).
+        Поддерживается только переход вперёд без подсчёта количества,
+        в остальных случаях возвращает None, и страница строится по queryset.
+        """
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        if request.query_params.get('count') == 'true':
+            return None
+        if self.cursor is not None and (self.cursor.reverse or self.cursor.offset):
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = (self.ordering,)
+        self.count = None
+        after = int(self.cursor.position) if self.cursor is not None and self.cursor.position else None
+
+        size = self.page_size + 1
+        feed = heapq.merge(get_own_page(after, size), get_public_page(after, size), key=itemgetter('id'))
+        results = list(islice(feed, size))
+        self.page = results[:self.page_size]
+
+        self.has_next = len(results) > self.page_size
+        self.next_position = str(results[-1]['id']) if self.has_next else None
+        self.has_previous = after is not None
+        self.previous_position = str(after) if self.has_previous else None
+        return self.page
@@ -2,5 +2,11 @@ from rest_framework.permissions import BasePermission
 
 
 class IsOwner(BasePermission):
-    def has_permission(self, request, view):
-        return request.user == view.get_object().owner
+    """
+    Доступ только к собственным привычкам.
+    Проверяется на объекте, который view уже получил в get_object(),
+    поэтому дополнительного запроса к БД не требуется.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        return obj.owner_id == request.user.pk
@@ -0,0 +1,114 @@
+import logging
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+from habits.models import Habit
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache
+def get_redis_client(url):
+    return redis.Redis.from_url(url)
+
+
+def get_schedule_index():
+    """ Индекс расписания или None, если он не включён (HABIT_SCHEDULE_INDEX_URL не задан) """
+
+    url = settings.HABIT_SCHEDULE_INDEX_URL
+    if not url:
+        return None
+    return ScheduleIndex(get_redis_client(url))
+
+
+def index_habits(items, index=None):
+    """
+    Обновляет время начала привычек вида (id, start_time) в индексе расписания, если он включён.
+    Нужна там, где сигналы модели не вызываются (UPDATE, bulk_create, bulk_update).
+    """
+
+    index = index or get_schedule_index()
+    if index is None:
+        return
+    try:
+        index.add_many(items)
+    except redis.RedisError as exc:
+        # расхождение будет найдено командой rebuild_schedule_index --check
+        logger.warning('Не удалось обновить индекс расписания: %s', exc)
+
+
+class ScheduleIndex:
+    """
+    Индекс расписания привычек в Redis: sorted set, элементы которого - id привычек,
+    а score - время начала (unix timestamp).
+    Позволяет найти привычки, о которых пора напомнить, за O(log n + k) без обращения к БД.
+    """
+
+    def __init__(self, client, key=None):
+        self.client = client
+        self.key = key or settings.HABIT_SCHEDULE_INDEX_KEY
+
+    def add(self, habit_id, start_time):
+        self.add_many([(habit_id, start_time)])
+
+    def add_many(self, items):
+        """ Добавляет (или обновляет время начала) привычки вида (id, start_time) """
+
+        mapping = {habit_id: start_time.timestamp() for habit_id, start_time in items}
+        if mapping:
+            self.client.zadd(self.key, mapping)
+
+    def remove(self, habit_id):
+        self.client.zrem(self.key, habit_id)
+
+    def due(self, min_time, max_time):
+        """ id привычек со временем начала в интервале [min_time, max_time) """
+
+        members = self.client.zrangebyscore(self.key, min_time.timestamp(), f'({max_time.timestamp()}')
+        return [int(member) for member in members]
+
+    def rebuild(self, batch_size=5000):
+        """
+        Заполняет индекс заново по данным БД.
+        Новый индекс собирается под временным ключом и атомарно подменяет старый.
+        """
+
+        tmp_key = f'{self.key}:rebuild'
+        self.client.delete(tmp_key)
+        tmp_index = ScheduleIndex(self.client, tmp_key)
+
+        count = 0
+        batch = []
+        for item in Habit.objects.values_list('id', 'start_time').iterator(chunk_size=batch_size):
+            batch.append(item)
+            if len(batch) == batch_size:
+                tmp_index.add_many(batch)
+                count += len(batch)
+                batch = []
+        tmp_index.add_many(batch)
+        count += len(batch)
+
+        if count:
+            self.client.rename(tmp_key, self.key)
+        else:
+            self.client.delete(self.key)
+        return count
+
+    def check(self):
+        """
+        Сверяет индекс с БД. Возвращает словарь со списками id привычек:
+        missing - нет в индексе, stale - нет в БД, mismatched - время начала не совпадает.
+        """
+
+        indexed = {int(member): score for member, score in self.client.zrange(self.key, 0, -1, withscores=True)}
+        report = {'missing': [], 'stale': [], 'mismatched': []}
+        for habit_id, start_time in Habit.objects.values_list('id', 'start_time').iterator():
+            score = indexed.pop(habit_id, None)
+            if score is None:
+                report['missing'].append(habit_id)
+            elif score != start_time.timestamp():
+                report['mismatched'].append(habit_id)
+        report['stale'] = sorted(indexed)
+        return report
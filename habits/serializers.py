@@ -1,27 +1,53 @@
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from config.mixins import SparseFieldsSerializerMixin, TimedSerializerMixin
 from habits.models import Habit
 
 
-class HabitSerializer(serializers.ModelSerializer):
+class HabitRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Связанная привычка. При пакетной обработке все связанные привычки
+    загружаются заранее одним запросом и передаются в context['related_habits'].
+    """
+
+    def to_internal_value(self, data):
+        related_habits = self.context.get('related_habits')
+        if related_habits is None:
+            return super().to_internal_value(data)
+        try:
+            return related_habits[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class HabitSerializer(SparseFieldsSerializerMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    serializer_related_field = HabitRelatedField
 
     class Meta:
         model = Habit
-        exclude = ('owner',)
+        exclude = ('owner', 'interval_days', 'updated_at')
 
     def validate(self, data):
-        if data['related_to']:
-            if data['reward']:
+        # при обновлении (PATCH) отсутствующие поля берутся из привычки: правила проверяются
+        # для итогового состояния. Сохранённая связанная привычка уже проверена, поэтому
+        # достаточно её id - без запроса к БД для каждой привычки при пакетном обновлении
+        related_to = data.get('related_to', getattr(self.instance, 'related_to_id', None))
+        reward = data.get('reward', getattr(self.instance, 'reward', None))
+        is_nice = data.get('is_nice', getattr(self.instance, 'is_nice', None))
+        if related_to:
+            if reward:
                 raise ValidationError(
                     'Одновременный выбор связанной привычки и указание вознаграждения некорректно.'
                 )
-            if not data['related_to'].is_nice:
+            if 'related_to' in data and not related_to.is_nice:
                 raise ValidationError(
                     'В связанные привычки могут попадать только привычки с признаком приятной привычки.'
                 )
-        if data['is_nice']:
-            if data['reward'] or data['related_to']:
+        if is_nice:
+            if reward or related_to:
                 raise ValidationError(
                     'У приятной привычки не может быть вознаграждения или связанной привычки.'
                 )
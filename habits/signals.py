@@ -0,0 +1,53 @@
+import logging
+
+import redis
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from habits.cache import bump_public_version
+from habits.models import Habit
+from habits.schedule import get_schedule_index, index_habits
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Habit)
+def index_habit(sender, instance, **kwargs):
+    """
+    Обновляет время начала привычки в индексе расписания после фиксации транзакции:
+    изменения откатанной транзакции в индекс не попадают.
+    """
+
+    item = (instance.pk, instance.start_time)
+    transaction.on_commit(lambda: index_habits([item]))
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def invalidate_public_habits(sender, instance, **kwargs):
+    """
+    Новая версия кэша публичных привычек при любом изменении привычки.
+    Версия меняется после фиксации транзакции: иначе параллельный запрос успел бы
+    закэшировать под новой версией ещё не изменённые данные.
+    """
+
+    transaction.on_commit(bump_public_version)
+
+
+@receiver(post_delete, sender=Habit)
+def unindex_habit(sender, instance, **kwargs):
+    """ Удаляет привычку из индекса расписания после фиксации транзакции """
+
+    habit_id = instance.pk
+    transaction.on_commit(lambda: remove_from_index(habit_id))
+
+
+def remove_from_index(habit_id):
+    index = get_schedule_index()
+    if index is None:
+        return
+    try:
+        index.remove(habit_id)
+    except redis.RedisError as exc:
+        logger.warning('Не удалось удалить привычку %s из индекса расписания: %s', habit_id, exc)
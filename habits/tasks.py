@@ -1,50 +1,289 @@
-import requests
+import logging
+import time
 from datetime import datetime, timedelta
+from itertools import chain, groupby
+from operator import attrgetter, itemgetter
+
+import redis
 from celery import shared_task
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, When
+from django.db.models.functions import Now
 from django.utils import timezone
 
-from habits.models import Habit
+from config import metrics
+from habits.cache import bump_public_version
+from habits.deliveries import claim_deliveries, mark_deliveries, release_stale_deliveries
+from habits.models import INTERVAL_DAYS, Habit, ReminderDelivery, SchedulerWatermark
+from habits.schedule import get_schedule_index, index_habits
+from habits.telegram import TelegramDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+def get_reminder_text(start_time, action):
+    """ Текст напоминания о привычке """
+
+    # корректировка для отображения времени в уведомлении по МСК
+    start_time = start_time + timedelta(hours=3)
+    return (f'Не забудь, сегодня в {start_time.hour}ч. и '
+            f'{start_time.minute}мин. по МСК нужно {action}')
+
+
+# ограничение Telegram на длину одного сообщения
+TG_MESSAGE_MAX_LENGTH = 4096
+DIGEST_TITLE = 'Напоминания о привычках:'
+
+
+def get_digest_texts(texts):
+    """
+    Сводка нескольких напоминаний в одном сообщении. Если она длиннее TG_MESSAGE_MAX_LENGTH,
+    делится на несколько сообщений по границам напоминаний.
+    Возвращает [(текст, количество вошедших напоминаний)].
+    """
+
+    digests = []
+    lines = [DIGEST_TITLE]
+    for text in texts:
+        if len(lines) > 1 and sum(len(line) + 1 for line in lines) + len(text) + 2 > TG_MESSAGE_MAX_LENGTH:
+            digests.append(('\n'.join(lines), len(lines) - 1))
+            lines = [DIGEST_TITLE]
+        lines.append(f'• {text}')
+    digests.append(('\n'.join(lines), len(lines) - 1))
+    return digests
+
+
+def build_messages(deliveries):
+    """
+    Сообщения для отправки: [(chat_id, text, доставки, которые оно закрывает)].
+    При TG_REMINDER_DIGEST напоминания одного чата собираются в одно сообщение-сводку,
+    иначе на каждое напоминание отправляется своё сообщение.
+    """
+
+    if not settings.TG_REMINDER_DIGEST:
+        return [(delivery.chat_id, delivery.text, [delivery]) for delivery in deliveries]
+
+    messages = []
+    deliveries = sorted(deliveries, key=attrgetter('chat_id', 'occurrence_time'))
+    for chat_id, chat_deliveries in groupby(deliveries, key=attrgetter('chat_id')):
+        chat_deliveries = list(chat_deliveries)
+        if len(chat_deliveries) == 1:
+            messages.append((chat_id, chat_deliveries[0].text, chat_deliveries))
+            continue
+        start = 0
+        for text, count in get_digest_texts([delivery.text for delivery in chat_deliveries]):
+            messages.append((chat_id, text, chat_deliveries[start:start + count]))
+            start += count
+    return messages
+
+
+def advance_start_time(habits, max_time, periods):
+    """
+    Переносит время начала привычек на первое наступление не раньше max_time:
+    по одному UPDATE на каждое значение interval_days.
+    periods - {interval_days: количества периодов, на которые переносятся привычки};
+    больше одного периода нужно, если интервал обработки длиннее периодичности (простой воркера).
+    """
+
+    for days in sorted(set(INTERVAL_DAYS.values())):
+        interval = timedelta(days=days)
+        counts = sorted(periods.get(days, {1}))
+        # наименьшее количество периодов, после которого время начала не раньше max_time
+        start_time = Case(
+            *(When(start_time__gte=max_time - count * interval, then=F('start_time') + count * interval)
+              for count in counts[:-1]),
+            default=F('start_time') + counts[-1] * interval,
+            output_field=DateTimeField(),
+        )
+        habits.filter(interval_days=days).update(start_time=start_time, updated_at=Now())
+
+
+def deliver_reminders(delivery_ids, status):
+    """
+    Отправляет доставки из статуса status, сохраняет итог и ставит повторы неотправленных
+    отдельной задачей retry_reminder_deliveries с экспоненциальной задержкой.
+    """
+
+    messages = build_messages(claim_deliveries(delivery_ids, status))
+    with TelegramDispatcher() as dispatcher:
+        stats = dispatcher.dispatch([(chat_id, text) for chat_id, text, _ in messages])
+
+    failed_indexes = set(stats.failed_indexes)
+    sent, failed = [], []
+    for index, (_, _, deliveries) in enumerate(messages):
+        (failed if index in failed_indexes else sent).extend(deliveries)
+    retries = mark_deliveries(sent, failed)
+    for delay, ids in retries.items():
+        retry_reminder_deliveries.apply_async((ids,), countdown=delay)
+
+    metrics.REMINDER_MESSAGES.labels('sent').inc(stats.sent)
+    metrics.REMINDER_MESSAGES.labels('failed').inc(stats.failed)
+    now = time.time()
+    for delivery in sent:
+        remind_at = delivery.occurrence_time - settings.TG_REMINDER_LEAD_TIME
+        metrics.REMINDER_LATENESS.observe(max(0.0, now - remind_at.timestamp()))
+    return {**stats.as_dict(), 'retries': sum(len(ids) for ids in retries.values())}
+
+
+@shared_task
+def send_tg_message_chunk(delivery_ids):
+    """
+    Рассылает порцию напоминаний (id доставок ReminderDelivery).
+    Выполняется на отдельной очереди TG_NOTIFICATIONS_QUEUE (см. CELERY_TASK_ROUTES).
+    """
+
+    return deliver_reminders(delivery_ids, ReminderDelivery.PENDING)
+
+
+@shared_task
+def retry_reminder_deliveries(delivery_ids):
+    """ Повторная отправка напоминаний, не доставленных с прошлой попытки """
+
+    return deliver_reminders(delivery_ids, ReminderDelivery.RETRYING)
+
+
+def collect_reminders(min_time, max_time, now):
+    """
+    Собирает напоминания (несохранённые ReminderDelivery) о привычках со временем начала
+    в интервале [min_time, max_time) и переносит эти привычки на первое наступление
+    не раньше max_time. Если за интервал привычка наступала несколько раз, напоминание
+    отправляется только о последнем наступлении, а уже прошедшие (раньше now) пропускаются.
+    Число запросов к БД не зависит от количества привычек: один SELECT,
+    читаемый порциями, и по одному UPDATE на каждую периодичность.
+    Если включён индекс расписания (HABIT_SCHEDULE_INDEX_URL), привычки ищутся в нём,
+    и при отсутствии привычек таблица привычек не читается.
+    """
+
+    due_habits = Habit.objects.filter(start_time__gte=min_time, start_time__lt=max_time)
+
+    index = get_schedule_index()
+    if index is not None:
+        # кандидаты берутся из индекса расписания в Redis, БД читается только по первичному ключу
+        try:
+            due_ids = index.due(min_time, max_time)
+        except redis.RedisError as exc:
+            logger.warning('Индекс расписания недоступен, поиск привычек по БД: %s', exc)
+            index = None
+        else:
+            if not due_ids:
+                return []
+            due_habits = due_habits.filter(id__in=due_ids)
+
+    # только нужные для сообщения колонки, chat_id берётся из JOIN с владельцем
+    rows = due_habits.values_list('id', 'start_time', 'interval_days', 'action', 'owner__tg_chat_id')
+    deliveries = []
+    rescheduled = []
+    periods = {}
+    skipped = 0
+    for habit_id, start_time, interval_days, action, chat_id in rows.iterator(
+            chunk_size=settings.TG_REMINDER_FETCH_SIZE):
+        interval = timedelta(days=interval_days)
+        count = -((start_time - max_time) // interval)
+        periods.setdefault(interval_days, set()).add(count)
+        rescheduled.append((habit_id, start_time + count * interval))
+        occurrence_time = start_time + (count - 1) * interval
+        if occurrence_time < now:
+            skipped += 1
+        elif chat_id:
+            deliveries.append(ReminderDelivery(habit_id=habit_id, occurrence_time=occurrence_time, chat_id=chat_id,
+                                               text=get_reminder_text(occurrence_time, action)))
+    advance_start_time(due_habits, max_time, periods)
+
+    if skipped:
+        logger.warning('Пропущены напоминания о прошедших наступлениях привычек: %s', skipped)
+        metrics.REMINDER_MESSAGES.labels('skipped').inc(skipped)
+
+    # UPDATE не вызывает сигналы модели, поэтому индекс и кэш публичных привычек обновляются явно
+    if index is not None:
+        transaction.on_commit(lambda: index_habits(rescheduled, index))
+    if rescheduled:
+        transaction.on_commit(bump_public_version)
+    return deliveries
 
 
 @shared_task
 def send_tg_message():
     """
-    Отправляет пользователю (создателю привычки) сообщение в Telegramm
-    с напоминанием о выполнении запланированного действия.
+    Находит привычки, о которых пора напомнить пользователю (создателю привычки)
+    в Telegramm, переносит их на следующий период и распределяет отправку
+    напоминаний порциями по TG_REMINDER_CHUNK_SIZE между подзадачами send_tg_message_chunk.
     """
 
-    url = f'https://api.telegram.org/bot{settings.TG_BOT_API_KEY}/sendMessage'
-    # вычисление параметров для фильтрации привычек по времени выполнения,
-    # чтобы запустить уведомление мин. за 10 минут до старта запланированного действия,
-    # но не дублировать при следующем цикле задачи.
-    default_timezone = timezone.get_default_timezone()
-    min_time = datetime.now(default_timezone) + timedelta(minutes=10)
+    with metrics.REMINDER_TICK_DURATION.time():
+        result = schedule_reminders()
+    metrics.REMINDER_DUE.observe(result['due'])
+    return result
+
+
+def schedule_reminders():
+    """ Собирает напоминания за интервал с прошлого запуска и ставит подзадачи рассылки """
+
+    # уведомление отправляется мин. за TG_REMINDER_LEAD_TIME до старта запланированного действия.
+    # Каждый запуск обрабатывает интервал [отметка предыдущего запуска, now + TG_REMINDER_LEAD_TIME),
+    # поэтому опоздавший или пропущенный запуск не теряет напоминаний,
+    # а пересекающиеся запуски не обрабатывают один интервал дважды.
+    now = datetime.now(timezone.get_default_timezone())
+    max_time = now + settings.TG_REMINDER_LEAD_TIME
     task_interval = settings.CELERY_BEAT_SCHEDULE['send_tg_message']['schedule']
-    max_time = min_time + task_interval
-    time_filter = {'start_time__gte': min_time,
-                   'start_time__lt': max_time}
-
-    for habit in Habit.objects.filter(**time_filter):
-        # корректировка для отображения времени в уведомлении по МСК
-        start_time = habit.start_time + timedelta(hours=3)
-        # данные для запроса
-        chat_id = habit.owner.tg_chat_id
-        data = {'chat_id': chat_id,
-                'text': f'Не забудь, сегодня в {start_time.hour}ч. и '
-                        f'{start_time.minute}мин. по МСК нужно {habit.action}'}
-        try:
-            response = requests.post(url, data)
-            response.raise_for_status()
-        except requests.exceptions.RequestException:
-            print("Что-то пошло не так:(")
-        finally:
-            if habit.interval == 'ежедневно':
-                habit.start_time += timedelta(days=1)
-            elif habit.interval == 'раз в 2 дня':
-                habit.start_time += timedelta(days=2)
-            elif habit.interval == 'раз в 3 дня':
-                habit.start_time += timedelta(days=3)
-            elif habit.interval == 'раз в неделю':
-                habit.start_time += timedelta(days=7)
-            habit.save(update_fields=['start_time'])
+
+    with transaction.atomic():
+        # блокировка строки с отметкой не даёт параллельным запускам обработать один интервал
+        watermark, _ = SchedulerWatermark.objects.select_for_update().get_or_create(
+            name='send_tg_message', defaults={'value': max_time - task_interval}
+        )
+        if watermark.value >= max_time:
+            return {'due': 0, 'chunks': 0}
+
+        min_time = watermark.value
+        deliveries = collect_reminders(min_time, max_time, now)
+        watermark.value = max_time
+        watermark.save(update_fields=['value'])
+
+        rows = []
+        if deliveries:
+            # уже записанные наступления (повторная обработка интервала) не дублируются,
+            # а подзадачам достаются только ещё не отправлявшиеся напоминания
+            ReminderDelivery.objects.bulk_create(deliveries, ignore_conflicts=True,
+                                                 batch_size=settings.TG_REMINDER_FETCH_SIZE)
+            rows = ReminderDelivery.objects.filter(
+                occurrence_time__gte=min_time, occurrence_time__lt=max_time, status=ReminderDelivery.PENDING,
+            ).order_by('chat_id', 'id').values_list('chat_id', 'id')
+
+        chunks = get_chunks(rows)
+        # ошибка постановки одной подзадачи (брокер недоступен) не мешает поставить остальные,
+        # а её напоминания остаются в ожидании и ставятся снова requeue_stale_deliveries
+        for chunk in chunks:
+            transaction.on_commit(lambda chunk=chunk: send_tg_message_chunk.delay(chunk), robust=True)
+    return {'due': len(deliveries), 'chunks': len(chunks)}
+
+
+def get_chunks(rows):
+    """
+    Делит доставки вида (chat_id, id), упорядоченные по chat_id, на порции по TG_REMINDER_CHUNK_SIZE.
+    В режиме сводки все напоминания чата попадают в одну подзадачу и уходят одним сообщением,
+    а размер подзадачи считается в чатах - по числу отправляемых сообщений.
+    """
+
+    if settings.TG_REMINDER_DIGEST:
+        groups = [[delivery_id for _, delivery_id in group] for _, group in groupby(rows, key=itemgetter(0))]
+    else:
+        groups = [[delivery_id] for _, delivery_id in rows]
+    chunk_size = settings.TG_REMINDER_CHUNK_SIZE
+    return [list(chain.from_iterable(groups[i:i + chunk_size])) for i in range(0, len(groups), chunk_size)]
+
+
+@shared_task
+def requeue_stale_deliveries():
+    """
+    Снова ставит в очередь рассылку доставок, зависших дольше TG_REMINDER_STALE_TIMEOUT
+    (см. release_stale_deliveries): напоминание не теряется, если подзадача не была поставлена
+    или воркер завершился во время отправки. Запускается по расписанию (CELERY_BEAT_SCHEDULE).
+    """
+
+    released = release_stale_deliveries(settings.TG_REMINDER_STALE_TIMEOUT)
+    for chunk in get_chunks(released[ReminderDelivery.PENDING]):
+        send_tg_message_chunk.delay(chunk)
+    for chunk in get_chunks(released[ReminderDelivery.RETRYING]):
+        retry_reminder_deliveries.delay(chunk)
+    return {status: len(items) for status, items in released.items()}
@@ -0,0 +1,96 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DispatchStats:
+    """ Итоги одной рассылки: количество отправленных/неотправленных сообщений и затраченное время """
+
+    sent: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    # позиции неотправленных сообщений в списке рассылки
+    failed_indexes: list = field(default_factory=list)
+
+    @property
+    def total(self):
+        return self.sent + self.failed
+
+    @property
+    def throughput(self):
+        """ Пропускная способность рассылки, сообщений в секунду """
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {'sent': self.sent, 'failed': self.failed,
+                'elapsed': round(self.elapsed, 3), 'throughput': round(self.throughput, 1)}
+
+
+class TelegramDispatcher:
+    """
+    Отправляет сообщения в Telegram через пул keep-alive соединений,
+    выполняя не более `concurrency` запросов одновременно.
+    """
+
+    def __init__(self, api_url=None, token=None, concurrency=None, timeout=None):
+        api_url = api_url or settings.TG_API_URL
+        token = token or settings.TG_BOT_API_KEY
+        self.url = f'{api_url}/bot{token}/sendMessage'
+        self.concurrency = concurrency or settings.TG_DISPATCH_CONCURRENCY
+        self.timeout = timeout or settings.TG_DISPATCH_TIMEOUT
+
+        # размер пула соединений совпадает с числом потоков,
+        # чтобы каждый поток переиспользовал своё соединение
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def send(self, chat_id, text):
+        """ Отправляет одно сообщение, возвращает True при успехе """
+
+        try:
+            response = self.session.post(self.url, data={'chat_id': chat_id, 'text': text}, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as exc:
+            logger.warning('Не удалось отправить сообщение в чат %s: %s', chat_id, exc)
+            return False
+        return True
+
+    def dispatch(self, messages):
+        """
+        Рассылает сообщения вида (chat_id, text) параллельно
+        и возвращает статистику рассылки.
+        """
+
+        stats = DispatchStats()
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for index, is_sent in enumerate(executor.map(lambda message: self.send(*message), messages)):
+                if is_sent:
+                    stats.sent += 1
+                else:
+                    stats.failed += 1
+                    stats.failed_indexes.append(index)
+        stats.elapsed = time.monotonic() - started
+
+        logger.info('Рассылка напоминаний: отправлено %s, ошибок %s за %.2f с (%.1f сообщ./с)',
+                    stats.sent, stats.failed, stats.elapsed, stats.throughput)
+        return stats
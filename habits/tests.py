@@ -1,15 +1,43 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
 from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs
 
+import msgpack
 import requests
+from celery.concurrency.prefork import TaskPool
+from kombu.exceptions import OperationalError
 from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework import status, serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.test import APITestCase
+from prometheus_client import REGISTRY
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from habits.models import Habit
+from config.celery import start_metrics_server
+from config.timing import RequestTimings, collect_timings
+from habits.cache import get_cache_stats, get_public_version
+from habits.deliveries import get_delivery_stats
+from habits.models import INTERVAL_DAYS, Habit, ReminderDelivery, SchedulerWatermark
+from habits.schedule import get_schedule_index
 from habits.serializers import HabitSerializer
+from habits.tasks import (requeue_stale_deliveries, retry_reminder_deliveries, send_tg_message,
+                          send_tg_message_chunk)
+from habits.telegram import TelegramDispatcher
+from users.authentication import get_cached_user, invalidate_user
 from users.models import User
 
 
@@ -29,6 +57,13 @@ class HabitsAPITestCase(APITestCase):
         self.user.save()
         self.access_token = str(RefreshToken.for_user(self.user).access_token)
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        # число запросов в тестах считается для устоявшегося режима, когда пользователь уже в кэше
+        with self.captureOnCommitCallbacks(execute=True):
+            get_cached_user(self.user.pk)
+        # тесты выполняются в одном процессе, поэтому кэш в памяти процесса ведёт себя как общий
+        patcher = mock.patch('habits.views.is_cache_shared', return_value=True)
+        self.is_cache_shared = patcher.start()
+        self.addCleanup(patcher.stop)
 
         self.habit_1 = Habit.objects.create(
             place='Дом',
@@ -161,6 +196,262 @@ class HabitsAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 3)
 
+    def test_public_feed_cache(self):
+        """ Тестирование ленты привычек с кэшированием публичных привычек """
+
+        cache.clear()
+        other_user = User.objects.create(email='Other@mail.ru', tg_chat_id='1234567890', first_name='Other')
+        for number in range(6):
+            Habit.objects.create(place='Дом', action=f'Публичная {number}', reward='отдых', is_public=True,
+                                 start_time='2024-01-18T08:01:00+03:00', owner=other_user)
+
+        def get_feed():
+            url = '/habits/?pagination=cursor&page_size=3'
+            ids = []
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                ids += [habit['id'] for habit in response.data['results']]
+                url = response.data['next']
+            return ids
+
+        expected = list(Habit.objects.filter(Q(owner=self.user) | Q(is_public=True)).values_list('id', flat=True))
+        self.assertEqual(get_feed(), expected)
+        self.assertEqual(get_cache_stats(), {'hits': 0, 'misses': 3})
+
+        # публичные привычки и версия списка для ETag берутся из кэша, из БД - только собственные привычки
+        with self.assertNumQueries(1):
+            response = self.client.get('/habits/?pagination=cursor&page_size=3')
+        self.assertEqual(get_cache_stats(), {'hits': 1, 'misses': 3})
+
+        # изменение привычки инвалидирует кэш после фиксации транзакции
+        version = get_public_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Habit.objects.filter(owner=other_user).first().delete()
+            self.assertEqual(get_public_version(), version)
+        self.assertEqual(get_feed(), expected[:2] + expected[3:])
+
+        # обратный курсор обрабатывается по БД
+        response = self.client.get(response.data['next'])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([habit['id'] for habit in response.data['results']], expected[:2])
+
+    def test_list_query_shape(self):
+        """ Тестирование запроса списка привычек: одно индексируемое условие без UNION """
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/habits/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        habit_queries = [query['sql'] for query in context if 'FROM "habits_habit"' in query['sql']]
+        # COUNT для пагинатора и выборка страницы (версия списка для ETag - из кэша)
+        self.assertEqual(len(habit_queries), 2)
+        for sql in habit_queries:
+            self.assertNotIn('UNION', sql)
+            self.assertIn('"habits_habit"."owner_id" = %s' % self.user.pk, sql)
+            self.assertIn('"habits_habit"."is_public"', sql)
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Habit._meta.db_table)
+        self.assertEqual(constraints['habit_owner_id_idx']['columns'], ['owner_id', 'id'])
+        self.assertEqual(constraints['habit_public_id_idx']['columns'], ['id'])
+        self.assertEqual(constraints['habit_start_time_idx']['columns'], ['start_time'])
+
+    def test_cursor_pagination(self):
+        """ Тестирование курсорной пагинации списка привычек """
+
+        for number in range(10):
+            Habit.objects.create(place='Дом', action=f'Привычка {number}', reward='отдых',
+                                 start_time='2024-01-18T08:01:00+03:00', owner=self.user)
+
+        url = '/habits/?pagination=cursor&page_size=5'
+        ids = []
+        queries = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids += [habit['id'] for habit in response.data['results']]
+            queries.append(len(context))
+            url = response.data['next']
+
+        self.assertEqual(ids, sorted(Habit.objects.values_list('id', flat=True)))
+        # число запросов не зависит от глубины страницы и не включает COUNT
+        self.assertEqual(len(set(queries)), 1)
+
+        response = self.client.get('/habits/?pagination=cursor&count=true')
+        self.assertEqual(response.data['count'], 12)
+
+    def test_msgpack(self):
+        """ Тестирование формата MessagePack для ответа и тела запроса """
+
+        response = self.client.get('/habits/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), self.client.get('/habits/').json())
+
+        data = {'place': 'дом', 'action': 'Тестирование', 'reward': 'отдых', 'start_time': '2024-01-16T08:01:00+03:00'}
+        response = self.client.post('/habits/', msgpack.packb(data), content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['action'], 'Тестирование')
+
+    @override_settings(GZIP_MIN_LENGTH=1000)
+    def test_compression(self):
+        """ Тестирование сжатия ответов в зависимости от размера """
+
+        response = self.client.get(f'/habits/{self.habit_1.id}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        response = self.client.get('/habits/?pagination=cursor&page_size=100', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        for number in range(20):
+            Habit.objects.create(place='Дом', action=f'Привычка {number}', reward='отдых',
+                                 start_time='2024-01-18T08:01:00+03:00', owner=self.user)
+        response = self.client.get('/habits/?pagination=cursor&page_size=100', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 22)
+
+    def test_bench_renderers(self):
+        """ Тестирование команды bench_renderers """
+
+        out = StringIO()
+        call_command('bench_renderers', '--habits', '10', '--repeat', '1', stdout=out)
+        self.assertIn('msgpack', out.getvalue())
+
+    def test_bench_api(self):
+        """ Тестирование команды bench_api и проверки порогов """
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/bench.json'
+            call_command('bench_api', '--requests', '3', '--warmup', '1', '--password', '123456',
+                         '--output', output, stdout=StringIO())
+            with open(output) as file:
+                report = json.load(file)
+            self.assertEqual(report['results']['habit_retrieve']['queries'], 1)
+            self.assertIn('p95_ms', report['results']['token_obtain'])
+            # изменения откатываются
+            self.assertEqual(Habit.objects.count(), 2)
+
+            thresholds = f'{directory}/thresholds.json'
+            with open(thresholds, 'w') as file:
+                json.dump({'habit_list': {'queries': 1}}, file)
+            with self.assertRaisesMessage(CommandError, 'habit_list: queries'):
+                call_command('bench_api', '--requests', '1', '--warmup', '0', '--only', 'habit_list',
+                             '--thresholds', thresholds, stdout=StringIO())
+
+            report['results']['habit_retrieve']['queries'] = 0
+            with open(output, 'w') as file:
+                json.dump(report, file)
+            with self.assertRaisesMessage(CommandError, 'habit_retrieve: запросов 1, было 0'):
+                call_command('bench_api', '--requests', '1', '--warmup', '0', '--only', 'habit_retrieve',
+                             '--baseline', output, '--max-regression', '1000', stdout=StringIO())
+
+    def test_server_timing(self):
+        """ Тестирование замеров запроса в заголовке Server-Timing и логе """
+
+        with override_settings(SERVER_TIMING=True, SERVER_TIMING_REPEATED_QUERIES=100):
+            client = self.client_class()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+            with self.assertLogs('config.timing', 'INFO') as logs:
+                response = client.get('/habits/')
+        timing = response['Server-Timing']
+        for name in ('view', 'db', 'auth', 'serializer'):
+            self.assertIn(f'{name};dur=', timing)
+        self.assertIn('queries;desc="2"', timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['path'], record['status'], record['queries']), ('/habits/', 200, 2))
+
+        # одинаковые по виду запросы с разными литералами - признак N+1
+        timings = RequestTimings()
+        for habit_id in (1, 2, 3):
+            timings.add_query(f"SELECT * FROM habits_habit WHERE id = {habit_id} AND place = 'Дом'", 0)
+        timings.add_query('SELECT * FROM users_user WHERE id = %s', 0)
+        self.assertEqual(timings.repeated_queries(3),
+                         [("SELECT * FROM habits_habit WHERE id = ? AND place = ?", 3)])
+        # без Server-Timing (только метрики) виды запросов не собираются
+        with collect_timings() as timings:
+            User.objects.count()
+        self.assertEqual((timings.queries, timings.shapes), (1, {}))
+
+        with override_settings(SERVER_TIMING=True, SERVER_TIMING_REPEATED_QUERIES=1):
+            client = self.client_class()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+            with self.assertLogs('config.timing', 'WARNING') as logs:
+                client.get(f'/habits/{self.habit_1.id}/')
+        self.assertIn('repeated_queries', logs.records[0].getMessage())
+
+        # выключенный middleware не добавляет заголовок
+        self.assertNotIn('Server-Timing', self.client.get('/habits/'))
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_metrics(self):
+        """ Тестирование метрик Prometheus запросов API """
+
+        labels = {'view': 'HabitViewSet', 'action': 'list'}
+        before = REGISTRY.get_sample_value('db_queries_total', labels) or 0
+        self.client.get('/habits/')
+        self.assertEqual(REGISTRY.get_sample_value('db_queries_total', labels) - before, 2)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = response.content.decode()
+        for name in ('http_request_duration_seconds_bucket', 'db_queries_total',
+                     'db_query_duration_seconds_total', 'cache_requests_total'):
+            self.assertIn(name, content)
+        self.assertIn('action="list",method="GET",status="200",view="HabitViewSet"', content)
+
+        # не из внутренней сети метрики недоступны, а выключенные - не публикуются
+        response = self.client.get('/metrics', REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_async_views(self):
+        """ Тестирование асинхронного чтения привычек """
+
+        other = User.objects.create(email='other@mail.ru', tg_chat_id='1', first_name='Other')
+        Habit.objects.create(place='Парк', action='Гулять', is_nice=True, start_time=self.habit_1.start_time,
+                             owner=other, is_public=True)
+        hidden = Habit.objects.create(place='Парк', action='Бегать', is_nice=True, owner=other,
+                                      start_time=self.habit_1.start_time)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/async/habits/?page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual([habit['id'] for habit in data['results']], [self.habit_1.id, self.habit_2.id])
+        self.assertEqual(data['results'][1], self.client.get(f'/habits/{self.habit_2.id}/').json())
+        data = self.client.get(data['next']).json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertIsNone(data['next'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/async/habits/{self.habit_2.id}/')
+        self.assertEqual(response.json()['action'], self.habit_2.action)
+        self.assertEqual(self.client.get(f'/async/habits/{hidden.id}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/async/habits/?after=x').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post('/async/habits/').status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+        self.client.credentials()
+        response = self.client.get('/async/habits/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('WWW-Authenticate', response)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer invalid')
+        self.assertEqual(self.client.get('/async/habits/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_async_views_asgi(self):
+        """ Тестирование асинхронного чтения привычек через ASGI с пользователем не из кэша """
+
+        invalidate_user(self.user.pk)
+        with override_settings(SERVER_TIMING=True), self.assertLogs('config.timing', 'INFO'):
+            response = await self.async_client.get('/async/habits/',
+                                                   headers={'Authorization': f'Bearer {self.access_token}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 2)
+        # пользователь из БД и список привычек
+        self.assertIn('queries;desc="2"', response['Server-Timing'])
+
     def test_update(self):
         """ Тестирование редактирования привычки """
 
@@ -179,6 +470,24 @@ class HabitsAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(self.habit_1.interval, 'ежедневно')
 
+    def test_partial_update_validation(self):
+        """ Тестирование проверок при частичном обновлении: недостающие поля берутся из привычки """
+
+        # вознаграждение у привычки со связанной привычкой и у приятной привычки
+        for habit in (self.habit_2, self.habit_1):
+            response = self.client.patch(f'/habits/{habit.id}/', {'reward': 'торт'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            habit.refresh_from_db()
+            self.assertEqual(habit.reward, '')
+
+        response = self.client.patch('/habits/bulk/', [{'id': self.habit_2.id, 'reward': 'торт'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # вознаграждение вместе со снятием связанной привычки допустимо
+        response = self.client.patch(f'/habits/{self.habit_2.id}/', {'reward': 'торт', 'related_to': None},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_retrieve(self):
         """ Тестирование просмотра 1 привычки"""
 
@@ -187,12 +496,254 @@ class HabitsAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(serializer_data, response.data)
 
+    def test_sparse_fields(self):
+        """ Тестирование выбора полей ответа через ?fields= и ?omit= """
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/habits/{self.habit_1.pk}/?fields=action,start_time')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'id', 'action', 'start_time'})
+        # незапрошенные колонки не читаются из БД
+        habit_sql = [query['sql'] for query in context if 'FROM "habits_habit"' in query['sql']]
+        self.assertNotIn('"habits_habit"."reward"', habit_sql[0])
+        self.assertIn('"habits_habit"."owner_id"', habit_sql[0])
+
+        response = self.client.get('/habits/?omit=reward,place')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for habit in response.data['results']:
+            self.assertNotIn('reward', habit)
+            self.assertNotIn('place', habit)
+            self.assertIn('action', habit)
+
+        response = self.client.get('/habits/?pagination=cursor&fields=action')
+        self.assertEqual([set(habit) for habit in response.data['results']], [{'id', 'action'}] * 2)
+
+        # в запросах на изменение параметры не влияют на набор полей
+        response = self.client.patch(f'/habits/{self.habit_2.pk}/?fields=action', {'place': 'Офис'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['place'], 'Офис')
+
+    def test_conditional_get(self):
+        """ Тестирование ETag и Last-Modified у списка и отдельной привычки """
+
+        for url in ('/habits/', f'/habits/{self.habit_1.id}/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+            # у списка только ETag: max(updated_at) не учитывает удаления
+            self.assertEqual(response.has_header('Last-Modified'), url != '/habits/')
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+
+            # другие параметры запроса - другое представление
+            response = self.client.get(f'{url}?page=1', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # после изменения привычки версия меняется
+            self.habit_1.refresh_from_db()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.habit_1.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response['ETag'], etag)
+
+        # ответ 304 для отдельной привычки не требует запросов кроме получения привычки
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/habits/{self.habit_1.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # ответ 304 для списка не требует запросов, удаление привычки меняет версию
+        etag = self.client.get('/habits/?pagination=cursor')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/habits/?pagination=cursor', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.habit_2.delete()
+        response = self.client.get('/habits/?pagination=cursor', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # кэш в памяти процесса не видит изменений других процессов: версия списка - из БД
+        self.is_cache_shared.return_value = False
+        etag = self.client.get('/habits/?pagination=cursor')['ETag']
+        # удаление без фиксации транзакции: версия кэша не меняется, как при удалении в другом процессе
+        Habit.objects.filter(pk=self.habit_1.pk).delete()
+        # версия списка и собственные привычки
+        with self.assertNumQueries(2):
+            response = self.client.get('/habits/?pagination=cursor', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_delete(self):
         """ Тестирование удаления привычки"""
 
         response = self.client.delete(f'/habits/{self.habit_1.id}/')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def bulk_item(self, number, **kwargs):
+        data = {'place': 'Дом', 'action': f'Привычка {number}', 'related_to': self.habit_1.id,
+                'interval': 'раз в 2 дня', 'start_time': '2024-01-18T08:01:00+03:00'}
+        data.update(kwargs)
+        return data
+
+    def test_bulk_create(self):
+        """ Тестирование пакетного создания привычек """
+
+        queries = []
+        for size in (2, 10):
+            items = [self.bulk_item(number) for number in range(size)]
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post('/habits/bulk/', items, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(response.data), size)
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+
+        habit = Habit.objects.get(pk=response.data[0]['id'])
+        self.assertEqual(habit.owner, self.user)
+        self.assertEqual(habit.related_to, self.habit_1)
+        self.assertEqual(habit.interval_days, 2)
+
+        # ошибки возвращаются для каждой привычки, ничего не создаётся
+        habits_count = Habit.objects.count()
+        items = [self.bulk_item(1), self.bulk_item(2, related_to=self.habit_2.id), self.bulk_item(3, related_to=999)]
+        response = self.client.post('/habits/bulk/', items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('non_field_errors', response.data[1])
+        self.assertIn('related_to', response.data[2])
+        self.assertEqual(Habit.objects.count(), habits_count)
+
+    def test_bulk_update(self):
+        """ Тестирование пакетного частичного обновления привычек """
+
+        other_user = User.objects.create(email='Other@mail.ru', tg_chat_id='1234567890', first_name='Other')
+        other_habit = Habit.objects.create(place='Дом', action='Чужая привычка', reward='отдых',
+                                           start_time='2024-01-18T08:01:00+03:00', owner=other_user)
+
+        items = [{'id': self.habit_1.id, 'interval': 'ежедневно'}, {'id': other_habit.id, 'place': 'Офис'}]
+        response = self.client.patch('/habits/bulk/', items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('id', response.data[1])
+
+        # некорректный id - ошибка у этого элемента, а не 500
+        items = [{'id': [self.habit_1.id]}, {'id': {'pk': 1}}, {'place': 'Офис'}]
+        response = self.client.patch('/habits/bulk/', items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([list(error) for error in response.data], [['id']] * 3)
+
+        items = [{'id': self.habit_1.id, 'interval': 'ежедневно'}, {'id': self.habit_2.id, 'place': 'Офис'}]
+        with self.assertNumQueries(4):
+            response = self.client.patch('/habits/bulk/', items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.habit_1.refresh_from_db()
+        self.habit_2.refresh_from_db()
+        self.assertEqual((self.habit_1.interval, self.habit_1.interval_days), ('ежедневно', 1))
+        self.assertEqual(self.habit_2.place, 'Офис')
+
+    def test_batch(self):
+        """ Тестирование получения привычек по списку id """
+
+        other_user = User.objects.create(email='Other@mail.ru', tg_chat_id='1234567890', first_name='Other')
+        private_habit = Habit.objects.create(place='Дом', action='Чужая привычка', reward='отдых',
+                                             start_time='2024-01-18T08:01:00+03:00', owner=other_user)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/habits/batch/?ids={self.habit_1.id},{self.habit_2.id},{private_habit.id}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([habit['id'] for habit in response.data], [self.habit_1.id, self.habit_2.id])
+        self.assertEqual(self.client.get('/habits/batch/?ids=a,b').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_import(self):
+        """ Тестирование выгрузки и загрузки привычек в NDJSON """
+
+        response = self.client.get('/habits/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b''.join(response.streaming_content)
+        lines = content.splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.habit_1.id, self.habit_2.id])
+        self.assertEqual(json.loads(lines[1])['related_to'], self.habit_1.id)
+
+        other_user = User.objects.create(email='Other@mail.ru', tg_chat_id='1234567890', first_name='Other')
+        self.client.force_authenticate(other_user)
+        # связанная привычка может идти в файле раньше той, на которую ссылается
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/habits/import/', b'\n'.join(reversed(lines)),
+                                        content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'created': 2, 'linked': 1})
+
+        habit_1, habit_2 = Habit.objects.filter(owner=other_user).order_by('is_nice')
+        self.assertEqual((habit_2.action, habit_2.interval_days), (self.habit_1.action, 7))
+        self.assertEqual(habit_1.related_to, habit_2)
+
+        # при ошибке не сохраняется ни одна привычка
+        habits_count = Habit.objects.count()
+        response = self.client.post('/habits/import/', lines[1] + b'\n{"place": "home"}',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['line'], '2')
+        self.assertEqual(Habit.objects.count(), habits_count)
+
+    def test_import_command(self):
+        """ Тестирование загрузки привычек командой import_habits пачками """
+
+        with tempfile.NamedTemporaryFile(suffix='.ndjson') as file:
+            call_command('export_habits', self.user.email, output=file.name)
+            Habit.objects.all().delete()
+            with CaptureQueriesContext(connection) as context:
+                call_command('import_habits', self.user.email, file.name, batch_size=1, stdout=StringIO())
+        self.assertEqual(Habit.objects.filter(related_to__isnull=False).count(), 1)
+        inserts = [query for query in context if query['sql'].startswith('INSERT INTO "habits_habit"')]
+        self.assertEqual(len(inserts), 2)
+
+    def test_detail_queries(self):
+        """ Тестирование числа запросов к БД у детальных запросов """
+
+        url = f'/habits/{self.habit_2.id}/'
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        with self.assertNumQueries(2):
+            self.client.patch(url, {'place': 'Офис'})
+        with self.assertNumQueries(3):
+            self.client.patch(url, {'related_to': self.habit_1.id})
+        with self.assertNumQueries(4):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_stateless_authentication(self):
+        """ Тестирование читающих запросов без обращения к пользователю (TokenUser) """
+
+        invalidate_user(self.user.pk)
+        with override_settings(AUTH_STATELESS_SAFE_METHODS=True):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(f'/habits/{self.habit_2.id}/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(context), 1)
+            self.assertNotIn('users_user', context[0]['sql'])
+
+            response = self.client.get('/habits/')
+            self.assertEqual(response.data['count'], 2)
+
+    def test_detail_access(self):
+        """ Тестирование доступа к чужим и несуществующим привычкам """
+
+        other_user = User.objects.create(email='Other@mail.ru', tg_chat_id='1234567890', first_name='Other')
+        other_habit = Habit.objects.create(place='Дом', action='Чужая привычка', reward='отдых', is_public=True,
+                                           start_time='2024-01-18T08:01:00+03:00', owner=other_user)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/habits/{other_habit.id}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.delete('/habits/999/').status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.credentials()
+        response = self.client.get(f'/habits/{self.habit_1.id}/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 class TasksAPITestCase(APITestCase):
 
@@ -242,3 +793,432 @@ class TasksAPITestCase(APITestCase):
             response = requests.post(url, data)
             response.raise_for_status()
             self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_worker_metrics_server(self):
+        """ Сервер метрик воркера prefork запускается только с каталогом PROMETHEUS_MULTIPROC_DIR """
+
+        worker = mock.Mock(pool=TaskPool(limit=1))
+        with mock.patch('prometheus_client.start_http_server') as start_http_server:
+            with mock.patch.dict('os.environ', {'CELERY_METRICS_PORT': '9808'}):
+                os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+                with self.assertLogs('config.celery', 'WARNING'):
+                    start_metrics_server(sender=worker)
+                self.assertFalse(start_http_server.called)
+
+                with tempfile.TemporaryDirectory() as multiproc_dir:
+                    os.environ['PROMETHEUS_MULTIPROC_DIR'] = multiproc_dir
+                    start_metrics_server(sender=worker)
+        start_http_server.assert_called_once_with(9808, registry=mock.ANY)
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    """ Локальный сервер, имитирующий метод sendMessage Telegram Bot API """
+
+    daemon_threads = True
+
+    def __init__(self, failing_chat_ids=()):
+        self.failing_chat_ids = set(failing_chat_ids)
+        self.messages = []
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), FakeTelegramHandler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        data = {key: value[0] for key, value in parse_qs(body).items()}
+        if data['chat_id'] in self.server.failing_chat_ids:
+            self.send_response(400)
+            payload = b'{"ok": false}'
+        else:
+            with self.server.lock:
+                self.server.messages.append(data)
+            self.send_response(200)
+            payload = json.dumps({'ok': True}).encode()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TelegramDispatcherTestCase(SimpleTestCase):
+
+    def test_dispatch(self):
+        """ Тестирование параллельной рассылки через пул соединений """
+
+        messages = [(str(chat_id), f'сообщение {chat_id}') for chat_id in range(50)]
+        with FakeTelegramServer(failing_chat_ids={'7'}) as server:
+            with TelegramDispatcher(api_url=server.url, token='test', concurrency=8) as dispatcher:
+                stats = dispatcher.dispatch(messages)
+
+        self.assertEqual(stats.sent, 49)
+        self.assertEqual(stats.failed, 1)
+        self.assertGreater(stats.throughput, 0)
+        self.assertEqual(len(server.messages), 49)
+        self.assertIn({'chat_id': '3', 'text': 'сообщение 3'}, server.messages)
+
+
+class SendTgMessageTestCase(APITestCase):
+
+    def setUp(self):
+        """ Подготовка тестовой базы """
+        super().setUp()
+        self.user = User.objects.create(email='Test@mail.ru', tg_chat_id='5564486290', first_name='Test')
+        self.start_time = datetime.now(timezone.get_default_timezone()) + timedelta(minutes=5)
+        self.watermark = SchedulerWatermark.objects.create(name='send_tg_message',
+                                                           value=self.start_time - timedelta(minutes=1))
+        # подзадачи рассылки выполняются сразу, без брокера
+        patcher = mock.patch.object(send_tg_message_chunk, 'delay', side_effect=send_tg_message_chunk)
+        self.delay = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_habit(self, **kwargs):
+        data = {'place': 'Дом', 'action': 'Выпить стакан воды', 'interval': 'ежедневно',
+                'start_time': self.start_time, 'owner': self.user}
+        data.update(kwargs)
+        return Habit.objects.create(**data)
+
+    def run_task(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return send_tg_message()
+
+    def test_send_tg_message(self):
+        """ Тестирование рассылки напоминаний задачей send_tg_message на локальный сервер """
+
+        habit = self.create_habit()
+        sent = REGISTRY.get_sample_value('habits_reminder_messages_total', {'result': 'sent'}) or 0
+        ticks = REGISTRY.get_sample_value('habits_reminder_tick_duration_seconds_count') or 0
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            stats = self.run_task()
+
+        self.assertEqual(REGISTRY.get_sample_value('habits_reminder_messages_total', {'result': 'sent'}), sent + 1)
+        self.assertEqual(REGISTRY.get_sample_value('habits_reminder_tick_duration_seconds_count'), ticks + 1)
+
+        self.assertEqual(stats, {'due': 1, 'chunks': 1})
+        self.assertEqual(server.messages[0]['chat_id'], self.user.tg_chat_id)
+        self.assertIn(habit.action, server.messages[0]['text'])
+        habit.refresh_from_db()
+        self.assertEqual(habit.start_time, self.start_time + timedelta(days=1))
+
+    def test_reschedule_intervals(self):
+        """ Тестирование переноса start_time на следующий период для всех видов периодичности """
+
+        habits = {interval: self.create_habit(interval=interval) for interval in INTERVAL_DAYS}
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            self.run_task()
+
+        for interval, habit in habits.items():
+            habit.refresh_from_db()
+            self.assertEqual(habit.start_time, self.start_time + timedelta(days=INTERVAL_DAYS[interval]))
+
+    def test_query_count(self):
+        """ Тестирование независимости числа запросов к БД от количества привычек """
+
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            for habits_count in (1, 30):
+                Habit.objects.all().delete()
+                self.watermark.save()
+                for _ in range(habits_count):
+                    self.create_habit()
+                # начало и конец транзакции, блокировка и сохранение отметки,
+                # SELECT привычек, UPDATE на каждую периодичность, INSERT доставок и SELECT их id;
+                # подзадача: транзакция с SELECT и UPDATE доставок и UPDATE отправленных
+                with self.assertNumQueries(7 + len(set(INTERVAL_DAYS.values())) + 5):
+                    stats = self.run_task()
+                self.assertEqual(stats['due'], habits_count)
+                self.assertEqual(len(server.messages), habits_count)
+                server.messages.clear()
+
+    @override_settings(TG_REMINDER_CHUNK_SIZE=2)
+    def test_fan_out(self):
+        """ Тестирование распределения напоминаний по подзадачам send_tg_message_chunk """
+
+        for _ in range(5):
+            self.create_habit()
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            stats = self.run_task()
+
+        self.assertEqual(stats, {'due': 5, 'chunks': 3})
+        self.assertEqual([len(call.args[0]) for call in self.delay.call_args_list], [2, 2, 1])
+        self.assertEqual(len(server.messages), 5)
+
+    def test_watermark(self):
+        """ Тестирование обработки расписания без пропусков и повторов между запусками """
+
+        # предыдущий запуск был час назад, привычка из пропущенного интервала всё равно обрабатывается
+        self.watermark.value = self.start_time - timedelta(hours=1)
+        self.watermark.save()
+        self.create_habit(start_time=self.start_time - timedelta(minutes=4))
+        self.create_habit()
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            self.assertEqual(self.run_task()['due'], 2)
+
+            # повторный запуск продолжает с новой отметки и не повторяет рассылку
+            self.watermark.refresh_from_db()
+            self.assertGreater(self.watermark.value, self.start_time)
+            self.assertEqual(self.run_task()['due'], 0)
+        self.assertEqual(len(server.messages), 2)
+
+    def test_outage(self):
+        """ Тестирование запуска после простоя дольше периодичности привычек """
+
+        now = self.start_time - timedelta(minutes=5)
+        self.watermark.value = now - timedelta(days=3)
+        self.watermark.save()
+        # последнее наступление за интервал уже прошло
+        past = self.create_habit(start_time=now - timedelta(days=1, hours=12))
+        # последнее наступление ещё впереди: напоминание о нём, а не о прошедших
+        upcoming = self.create_habit(start_time=self.start_time - timedelta(days=2))
+        weekly = self.create_habit(interval='еженедельно', start_time=now - timedelta(days=2))
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            self.assertEqual(self.run_task()['due'], 1)
+        self.assertEqual(len(server.messages), 1)
+        self.assertEqual(ReminderDelivery.objects.get().occurrence_time, self.start_time)
+
+        # привычки перенесены на первое наступление после обработанного интервала
+        self.watermark.refresh_from_db()
+        for habit, start_time in ((past, now + timedelta(hours=12)),
+                                  (upcoming, self.start_time + timedelta(days=1)),
+                                  (weekly, now + timedelta(days=5))):
+            habit.refresh_from_db()
+            self.assertEqual(habit.start_time, start_time)
+            self.assertGreaterEqual(habit.start_time, self.watermark.value)
+
+    def test_delivery_log(self):
+        """ Тестирование журнала доставок: повторная обработка интервала не отправляет напоминание дважды """
+
+        habit = self.create_habit()
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            self.run_task()
+            delivery = ReminderDelivery.objects.get()
+            self.assertEqual((delivery.habit_id, delivery.occurrence_time), (habit.id, self.start_time))
+            self.assertEqual((delivery.status, delivery.attempts), (ReminderDelivery.SENT, 1))
+
+            # тот же интервал и то же наступление привычки ещё раз
+            Habit.objects.filter(pk=habit.pk).update(start_time=self.start_time)
+            self.watermark.save()
+            self.assertEqual(self.run_task()['due'], 1)
+            # повторная доставка подзадачи брокером тоже ничего не отправляет
+            send_tg_message_chunk([delivery.id])
+        self.assertEqual(len(server.messages), 1)
+        self.assertEqual(ReminderDelivery.objects.count(), 1)
+
+    @override_settings(TG_REMINDER_MAX_ATTEMPTS=3, TG_REMINDER_RETRY_DELAY=30)
+    def test_delivery_retries(self):
+        """ Тестирование повторов недоставленных напоминаний с экспоненциальной задержкой """
+
+        self.create_habit()
+        with mock.patch.object(retry_reminder_deliveries, 'apply_async') as apply_async, \
+                self.assertLogs('habits.telegram', 'WARNING'):
+            with FakeTelegramServer(failing_chat_ids={self.user.tg_chat_id}) as server, \
+                    override_settings(TG_API_URL=server.url):
+                self.assertEqual(self.run_task()['due'], 1)
+                delivery = ReminderDelivery.objects.get()
+                self.assertEqual(delivery.status, ReminderDelivery.RETRYING)
+                apply_async.assert_called_once_with(([delivery.id],), countdown=30)
+
+                self.assertEqual(retry_reminder_deliveries([delivery.id])['retries'], 1)
+                self.assertEqual(apply_async.call_args.kwargs['countdown'], 60)
+
+                # после TG_REMINDER_MAX_ATTEMPTS попыток напоминание считается недоставленным
+                self.assertEqual(retry_reminder_deliveries([delivery.id])['retries'], 0)
+                delivery.refresh_from_db()
+                self.assertEqual((delivery.status, delivery.attempts), (ReminderDelivery.FAILED, 3))
+
+        stats = get_delivery_stats(self.start_time - timedelta(hours=1))
+        self.assertEqual((stats['failed'], stats['sent'], stats['delivery_rate']), (1, 0, 0.0))
+
+        ReminderDelivery.objects.update(status=ReminderDelivery.RETRYING)
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            self.assertEqual(retry_reminder_deliveries([delivery.id])['sent'], 1)
+        self.assertEqual(get_delivery_stats(self.start_time - timedelta(hours=1))['delivery_rate'], 1.0)
+
+    @override_settings(TG_REMINDER_CHUNK_SIZE=1)
+    def test_requeue_stale_deliveries(self):
+        """ Тестирование повторной постановки напоминаний, подзадачи которых не были поставлены или зависли """
+
+        for _ in range(3):
+            self.create_habit()
+
+        # брокер недоступен при постановке первой подзадачи: остальные всё равно ставятся
+        def delay(chunk):
+            if self.delay.call_count == 1:
+                raise OperationalError('connection refused')
+            return send_tg_message_chunk(chunk)
+
+        self.delay.side_effect = delay
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            with self.assertLogs('django', 'ERROR'):
+                self.assertEqual(self.run_task()['chunks'], 3)
+            self.assertEqual(self.delay.call_count, 3)
+        pending = ReminderDelivery.objects.get(status=ReminderDelivery.PENDING)
+
+        # воркер завершился во время отправки
+        sending = ReminderDelivery.objects.exclude(pk=pending.pk).first()
+        ReminderDelivery.objects.filter(pk=sending.pk).update(status=ReminderDelivery.SENDING)
+
+        # до истечения TG_REMINDER_STALE_TIMEOUT доставки не трогаются
+        self.delay.side_effect = send_tg_message_chunk
+        self.assertEqual(requeue_stale_deliveries(), {ReminderDelivery.PENDING: 0, ReminderDelivery.RETRYING: 0})
+
+        ReminderDelivery.objects.filter(pk__in=[pending.pk, sending.pk]).update(
+            updated_at=timezone.now() - timedelta(seconds=settings.TG_REMINDER_STALE_TIMEOUT + 1)
+        )
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url), \
+                mock.patch.object(retry_reminder_deliveries, 'delay', side_effect=retry_reminder_deliveries):
+            self.assertEqual(requeue_stale_deliveries(), {ReminderDelivery.PENDING: 1, ReminderDelivery.RETRYING: 1})
+        self.assertEqual(len(server.messages), 2)
+        self.assertEqual(ReminderDelivery.objects.filter(status=ReminderDelivery.SENT).count(), 3)
+
+    @override_settings(TG_REMINDER_DIGEST=True, TG_REMINDER_CHUNK_SIZE=1)
+    def test_digest(self):
+        """ Тестирование сводки: одно сообщение на чат, напоминания чата не делятся между подзадачами """
+
+        other = User.objects.create(email='other@mail.ru', tg_chat_id='100500')
+        first = self.create_habit()
+        second = self.create_habit(action='Сделать зарядку', start_time=self.start_time + timedelta(minutes=1))
+        self.create_habit(owner=other)
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            self.assertEqual(self.run_task(), {'due': 3, 'chunks': 2})
+
+        self.assertEqual(len(server.messages), 2)
+        messages = {message['chat_id']: message['text'] for message in server.messages}
+        text = messages[self.user.tg_chat_id]
+        self.assertLess(text.index(first.action), text.index(second.action))
+        self.assertNotIn('\n', messages[other.tg_chat_id])
+        self.assertEqual(ReminderDelivery.objects.filter(status=ReminderDelivery.SENT).count(), 3)
+
+    def test_first_run(self):
+        """ Тестирование первого запуска, когда отметки ещё нет """
+
+        SchedulerWatermark.objects.all().delete()
+        self.create_habit(start_time=datetime.now(timezone.get_default_timezone()) + timedelta(minutes=9, seconds=30))
+        with FakeTelegramServer() as server, override_settings(TG_API_URL=server.url):
+            self.assertEqual(self.run_task()['due'], 1)
+        self.assertTrue(SchedulerWatermark.objects.filter(name='send_tg_message').exists())
+
+
+class FakeRedis:
+    """ Минимальная in-process замена клиента Redis для sorted set """
+
+    def __init__(self):
+        self.data = {}
+
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update({str(member).encode(): score for member, score in mapping.items()})
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.data.get(key, {}).pop(str(member).encode(), None)
+
+    def zrangebyscore(self, key, min_score, max_score):
+        exclusive = isinstance(max_score, str) and max_score.startswith('(')
+        max_score = float(max_score.lstrip('(')) if isinstance(max_score, str) else max_score
+        return [member for member, score in sorted(self.data.get(key, {}).items(), key=lambda item: item[1])
+                if score >= min_score and (score < max_score if exclusive else score <= max_score)]
+
+    def zrange(self, key, start, end, withscores=False):
+        items = sorted(self.data.get(key, {}).items(), key=lambda item: item[1])
+        return items if withscores else [member for member, score in items]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def rename(self, src, dst):
+        self.data[dst] = self.data.pop(src)
+
+
+@override_settings(HABIT_SCHEDULE_INDEX_URL='redis://localhost:6379/15')
+class ScheduleIndexTestCase(APITestCase):
+
+    def setUp(self):
+        """ Подготовка тестовой базы и индекса расписания в памяти """
+        super().setUp()
+        patcher = mock.patch('habits.schedule.get_redis_client', return_value=FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(send_tg_message_chunk, 'delay')
+        self.delay = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.index = get_schedule_index()
+        self.user = User.objects.create(email='Test@mail.ru', tg_chat_id='5564486290', first_name='Test')
+        self.start_time = datetime.now(timezone.get_default_timezone()) + timedelta(minutes=5)
+        SchedulerWatermark.objects.create(name='send_tg_message', value=self.start_time - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.habit = Habit.objects.create(place='Дом', action='Выпить стакан воды',
+                                              start_time=self.start_time, owner=self.user)
+
+    def test_signals(self):
+        """ Тестирование обновления индекса при создании, изменении и удалении привычки """
+
+        window = (self.start_time, self.start_time + timedelta(minutes=1))
+        self.assertEqual(self.index.due(*window), [self.habit.id])
+
+        self.habit.start_time += timedelta(hours=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.habit.save()
+        self.assertEqual(self.index.due(*window), [])
+
+        # изменения откатанной транзакции в индекс не попадают
+        with transaction.atomic():
+            Habit.objects.create(place='Дом', action='Зарядка', start_time=self.start_time, owner=self.user)
+            transaction.set_rollback(True)
+        self.assertEqual(self.index.due(*window), [])
+
+        self.habit.start_time = self.start_time
+        with self.captureOnCommitCallbacks(execute=True):
+            self.habit.save()
+            self.habit.delete()
+        self.assertEqual(self.index.due(*window), [])
+
+    def test_send_tg_message(self):
+        """ Тестирование поиска привычек для рассылки по индексу расписания """
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Habit.objects.create(place='Дом', action='Зарядка', owner=self.user,
+                                 start_time=self.start_time + timedelta(hours=1))
+        with self.assertNumQueries(7 + len(set(INTERVAL_DAYS.values()))):
+            with self.captureOnCommitCallbacks(execute=True):
+                stats = send_tg_message()
+        self.assertEqual(stats, {'due': 1, 'chunks': 1})
+
+        # привычка перенесена на следующий день и в БД, и в индексе
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.start_time, self.start_time + timedelta(days=1))
+        self.assertEqual(self.index.check(), {'missing': [], 'stale': [], 'mismatched': []})
+
+        # если напоминать не о чем, таблица привычек не читается: только отметка планировщика
+        with self.assertNumQueries(4):
+            self.assertEqual(send_tg_message(), {'due': 0, 'chunks': 0})
+
+    def test_rebuild_and_check(self):
+        """ Тестирование команды rebuild_schedule_index """
+
+        Habit.objects.filter(pk=self.habit.pk).update(start_time=self.start_time + timedelta(hours=1))
+        self.index.add(999, self.start_time)
+        self.assertEqual(self.index.check(), {'missing': [], 'stale': [999], 'mismatched': [self.habit.id]})
+        with self.assertRaises(CommandError):
+            call_command('rebuild_schedule_index', '--check', stdout=StringIO())
+
+        call_command('rebuild_schedule_index', stdout=StringIO())
+        call_command('rebuild_schedule_index', '--check', stdout=StringIO())
+        self.assertEqual(self.index.check(), {'missing': [], 'stale': [], 'mismatched': []})
@@ -1,6 +1,8 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
 from habits.apps import HabitsConfig
+from habits.async_views import habit_list, habit_retrieve
 from habits.views import HabitViewSet
 
 app_name = HabitsConfig.name
@@ -8,4 +10,8 @@ app_name = HabitsConfig.name
 
 router = DefaultRouter()
 router.register(r'habits', HabitViewSet, basename='habits'),
-urlpatterns = router.urls
+urlpatterns = [
+    # асинхронное чтение привычек для ASGI (см. habits.async_views)
+    path('async/habits/', habit_list, name='async-habits-list'),
+    path('async/habits/<int:pk>/', habit_retrieve, name='async-habits-detail'),
+] + router.urls
@@ -1,36 +1,218 @@
-from rest_framework import viewsets
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
+from config.mixins import ConditionalGetMixin, SparseFieldsMixin
+from habits.backup import HabitImporter, export_habits
+from habits.cache import bump_public_version, get_public_page, get_public_version, is_cache_shared
 from habits.models import Habit
-from habits.paginators import HabitPaginator
+from habits.paginators import HabitCursorPaginator, HabitPaginator
 from habits.permissions import IsOwner
+from habits.schedule import index_habits
 from habits.serializers import HabitSerializer
 
 
-class HabitViewSet(viewsets.ModelViewSet):
+class HabitViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+    """
+    Привычки пользователя.
+    Детальные запросы получают привычку одним SELECT из queryset собственных привычек
+    (пользователь по JWT берётся из кэша, см. CachedJWTAuthentication):
+    retrieve - 1 запрос, update/partial_update - 2 (+ UPDATE) и ещё 1 при указании related_to,
+    destroy - 4 (+ поиск связанных привычек и доставок напоминаний для каскадного удаления и DELETE).
+    Читающие запросы используют только request.user.pk, поэтому допускают TokenUser (stateless_auth).
+    Чужие и несуществующие привычки дают 404 без проверки прав.
+    list и retrieve отдают ETag (retrieve и Last-Modified) и отвечают 304 без сериализации (ConditionalGetMixin),
+    версия list - версия кэша публичных привычек без запросов к БД (при общем кэше, CACHE_URL),
+    иначе ещё один агрегирующий запрос.
+    Пакетные bulk_create, bulk_update и batch выполняют постоянное число запросов
+    независимо от размера пакета (не более HABITS_BULK_MAX_SIZE привычек).
+    export и import выгружают и загружают все привычки пользователя в NDJSON (см. habits.backup).
+    """
+
     queryset = Habit.objects.all()
     serializer_class = HabitSerializer
     pagination_class = HabitPaginator
+    sparse_required_fields = ('id', 'owner', 'updated_at')
+    stateless_auth = True
+
+    @property
+    def paginator(self):
+        # курсорная пагинация включается клиентом: ?pagination=cursor
+        if self.request is not None and self.request.query_params.get('pagination') == 'cursor':
+            self.pagination_class = HabitCursorPaginator
+        return super().paginator
+
+    def get_list_version(self, request):
+        # версия кэша публичных привычек меняется при любом изменении и удалении привычек,
+        # в том числе пакетном (см. bump_public_version), поэтому подходит и для собственных.
+        # Кэш в памяти процесса не видит изменений других процессов - тогда агрегирующий запрос
+        if not is_cache_shared():
+            return super().get_list_version(request)
+        return f'{request.user.pk}-{get_public_version()}'
+
+    def get_list_response(self, request, *args, **kwargs):
+        if isinstance(self.paginator, HabitCursorPaginator):
+            # публичные привычки одинаковы для всех пользователей и берутся из кэша,
+            # из БД читаются только собственные непубличные
+            page = self.paginator.paginate_feed(self.get_own_page, get_public_page, request)
+            if page is not None:
+                return self.paginator.get_paginated_response(self.trim_fields(page))
+        return super().get_list_response(request, *args, **kwargs)
+
+    def get_own_page(self, after, size):
+        habits = self.filter_queryset(Habit.objects.filter(owner_id=self.request.user.pk, is_public=False))
+        if after is not None:
+            habits = habits.filter(id__gt=after)
+        return self.get_serializer(habits[:size], many=True).data
 
     def perform_create(self, serializer):
-        new_habit = serializer.save()
-        new_habit.owner = self.request.user
-        new_habit.save()
+        serializer.save(owner=self.request.user)
 
     def get_permissions(self):
-        if self.action in ['list', 'create']:
+        if self.action in ['list', 'create', 'bulk_create', 'bulk_update', 'batch', 'export', 'import_habits']:
             self.permission_classes = [IsAuthenticated]
         else:
-            self.permission_classes = [IsOwner]
+            self.permission_classes = [IsAuthenticated, IsOwner]
 
         return [permission() for permission in self.permission_classes]
 
     def get_queryset(self):
         user = self.request.user
-        if self.action == 'list':
-            own_habits = Habit.objects.filter(owner=user)
-            habits = Habit.objects.filter(is_public=True)
-            return own_habits.union(habits).order_by('id',)
+        if self.action in ['list', 'batch']:
+            # собственные и публичные привычки одним условием вместо UNION:
+            # такой queryset можно фильтровать и пагинировать,
+            # обе ветки OR покрыты индексами habit_owner_id_idx и habit_public_id_idx
+            return Habit.objects.filter(Q(owner_id=user.pk) | Q(is_public=True)).order_by('id',)
         else:
-            own_habits = Habit.objects.filter(owner=user).order_by('id',)
+            own_habits = Habit.objects.filter(owner_id=user.pk).order_by('id',)
             return own_habits
+
+    def get_bulk_items(self):
+        items = self.request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Ожидается список привычек.']})
+        if len(items) > settings.HABITS_BULK_MAX_SIZE:
+            raise ValidationError({'non_field_errors': [
+                f'Не более {settings.HABITS_BULK_MAX_SIZE} привычек за один запрос.'
+            ]})
+        return items
+
+    def get_bulk_serializer_context(self, items):
+        """ Контекст сериализатора со всеми связанными привычками пакета, загруженными одним запросом """
+
+        related_ids = set()
+        for item in items:
+            related_id = item.get('related_to') if isinstance(item, dict) else None
+            if isinstance(related_id, int) or (isinstance(related_id, str) and related_id.isdigit()):
+                related_ids.add(int(related_id))
+        context = self.get_serializer_context()
+        context['related_habits'] = Habit.objects.in_bulk(related_ids)
+        return context
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """ Создание списка привычек в одной транзакции, ошибки возвращаются для каждой привычки """
+
+        items = self.get_bulk_items()
+        context = self.get_bulk_serializer_context(items)
+        serializers = [self.get_serializer(data=item, context=context) for item in items]
+        errors = [{} if serializer.is_valid() else serializer.errors for serializer in serializers]
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        habits = [Habit(**serializer.validated_data, owner=request.user) for serializer in serializers]
+        for habit in habits:
+            habit.set_interval_days()
+        with transaction.atomic():
+            Habit.objects.bulk_create(habits)
+            transaction.on_commit(lambda: index_habits([(habit.pk, habit.start_time) for habit in habits]))
+            transaction.on_commit(bump_public_version)
+
+        return Response(self.get_serializer(habits, many=True).data, status=status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        """ Частичное обновление списка собственных привычек (у каждой указывается id) в одной транзакции """
+
+        items = self.get_bulk_items()
+        habit_ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+        habit_ids = [habit_id if isinstance(habit_id, int) and not isinstance(habit_id, bool) else None
+                     for habit_id in habit_ids]
+        habits = self.get_queryset().in_bulk([habit_id for habit_id in habit_ids if habit_id is not None])
+        context = self.get_bulk_serializer_context(items)
+
+        serializers = []
+        errors = []
+        for item, habit_id in zip(items, habit_ids):
+            if habit_id is None:
+                errors.append({'id': ['Ожидается целое число.']})
+                continue
+            habit = habits.get(habit_id)
+            if habit is None:
+                errors.append({'id': ['Привычка не найдена.']})
+                continue
+            serializer = self.get_serializer(habit, data=item, partial=True, context=context)
+            serializers.append(serializer)
+            errors.append({} if serializer.is_valid() else serializer.errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = {'updated_at'}
+        for serializer in serializers:
+            for attr, value in serializer.validated_data.items():
+                setattr(serializer.instance, attr, value)
+            serializer.instance.set_interval_days()
+            serializer.instance.updated_at = timezone.now()
+            fields.update(serializer.validated_data)
+        if 'interval' in fields:
+            fields.add('interval_days')
+
+        updated = [serializer.instance for serializer in serializers]
+        if updated:
+            with transaction.atomic():
+                Habit.objects.bulk_update(updated, fields)
+                transaction.on_commit(bump_public_version)
+                if 'start_time' in fields:
+                    transaction.on_commit(lambda: index_habits([(habit.pk, habit.start_time) for habit in updated]))
+
+        return Response(self.get_serializer(updated, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """ Собственные и публичные привычки по списку id: ?ids=1,2,3 """
+
+        try:
+            habit_ids = [int(habit_id) for habit_id in request.query_params.get('ids', '').split(',') if habit_id]
+        except ValueError:
+            raise ValidationError({'ids': ['Ожидается список id через запятую.']})
+        if len(habit_ids) > settings.HABITS_BULK_MAX_SIZE:
+            raise ValidationError({'ids': [f'Не более {settings.HABITS_BULK_MAX_SIZE} привычек за один запрос.']})
+
+        habits = self.get_queryset().filter(id__in=habit_ids)
+        return Response(self.get_serializer(habits, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """ Выгрузка всех собственных привычек потоком NDJSON """
+
+        response = StreamingHttpResponse(export_habits(request.user.pk), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="habits.ndjson"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_habits(self, request):
+        """
+        Загрузка привычек из тела запроса в формате NDJSON (как в export).
+        Тело читается построчно, без загрузки всего файла в память.
+        """
+
+        lines = iter(request.stream.readline, b'') if request.stream is not None else []
+        result = HabitImporter(request.user).run(lines)
+        return Response(result, status=status.HTTP_201_CREATED)
@@ -0,0 +1,219 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from config.metrics import CACHE_REQUESTS
+from config.timing import timer
+from users.models import User
+
+
+class LocalUserCache:
+    """
+    LRU-кэш пользователей в памяти процесса с ограниченным временем жизни записей.
+    Инвалидация через сигналы доходит только до текущего процесса,
+    поэтому в остальных процессах запись устаревает не позже чем через ttl секунд.
+    get() возвращает копию: запросы и потоки процесса не делят один экземпляр модели.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return copy.copy(value)
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+local_users = LocalUserCache(settings.AUTH_USER_LOCAL_CACHE_SIZE, settings.AUTH_USER_LOCAL_CACHE_TTL)
+
+
+def get_user_cache_key(user_id):
+    return f'users:auth:{user_id}'
+
+
+def remember_user(key, user):
+    """
+    Кэширует прочитанного из БД пользователя. Внутри транзакции - только после её фиксации:
+    прочитанная запись может содержать ещё не зафиксированные изменения, которые откатятся.
+    """
+
+    def remember():
+        cache.set(key, user, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+        local_users.set(key, user)
+
+    if connection.in_atomic_block:
+        transaction.on_commit(remember)
+    else:
+        remember()
+
+
+def get_cached_user(user_id):
+    """
+    Пользователь по id: из памяти процесса, затем из общего кэша (Redis) и только затем из БД.
+    Возвращает None, если пользователя нет.
+    """
+
+    key = get_user_cache_key(user_id)
+    user = local_users.get(key)
+    if user is not None:
+        CACHE_REQUESTS.labels('auth_user', 'local').inc()
+        return user
+
+    user = cache.get(key)
+    if user is not None:
+        CACHE_REQUESTS.labels('auth_user', 'shared').inc()
+    else:
+        CACHE_REQUESTS.labels('auth_user', 'miss').inc()
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            remember_user(key, copy.copy(user))
+        return user
+    local_users.set(key, user)
+    return user
+
+
+async def aget_cached_user(user_id):
+    """ get_cached_user() для асинхронного кода: общий кэш и БД без блокировки цикла событий """
+
+    key = get_user_cache_key(user_id)
+    user = local_users.get(key)
+    if user is not None:
+        CACHE_REQUESTS.labels('auth_user', 'local').inc()
+        return user
+
+    user = await cache.aget(key)
+    if user is not None:
+        CACHE_REQUESTS.labels('auth_user', 'shared').inc()
+    else:
+        CACHE_REQUESTS.labels('auth_user', 'miss').inc()
+        user = await User.objects.filter(pk=user_id).afirst()
+        if user is not None:
+            # в потоке асинхронного ORM, где видна транзакция подключения
+            await sync_to_async(remember_user)(key, copy.copy(user))
+        return user
+    local_users.set(key, user)
+    return user
+
+
+def invalidate_user(user_id):
+    """ Удаляет пользователя из кэшей после изменения, блокировки или удаления """
+
+    key = get_user_cache_key(user_id)
+    local_users.delete(key)
+    cache.delete(key)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация без запроса к users_user на каждый запрос:
+    пользователь берётся из кэша (см. get_cached_user).
+
+    При AUTH_STATELESS_SAFE_METHODS = True читающие запросы к view со stateless_auth = True
+    вообще не обращаются к пользователю: request.user - TokenUser с id из токена.
+    Такие view должны использовать только request.user.pk; заблокированный пользователь
+    сохраняет доступ на чтение до истечения access-токена.
+
+    aauthenticate() - то же для асинхронных view (habits.async_views), вне DRF.
+    """
+
+    def authenticate(self, request):
+        # экземпляр аутентификации создаётся на каждый запрос
+        self.request = request
+        with timer('auth'):
+            return super().authenticate(request)
+
+    async def aauthenticate(self, request, stateless_auth=False):
+        """
+        Аутентификация в асинхронном view: пара (пользователь, токен) или None без заголовка.
+        Проверка подписи токена не обращается к БД и выполняется прямо в цикле событий.
+        stateless_auth - то же, что одноимённый атрибут view.
+        """
+
+        with timer('auth'):
+            header = self.get_header(request)
+            raw_token = self.get_raw_token(header) if header is not None else None
+            if raw_token is None:
+                return None
+            validated_token = self.get_validated_token(raw_token)
+
+            user_id = self.get_user_id(validated_token)
+            if stateless_auth and self.is_stateless_request(request):
+                return api_settings.TOKEN_USER_CLASS(validated_token), validated_token
+            user = await aget_cached_user(user_id)
+            return self.check_user(user, validated_token), validated_token
+
+    @staticmethod
+    def is_stateless_request(request):
+        return settings.AUTH_STATELESS_SAFE_METHODS and request is not None and request.method in SAFE_METHODS
+
+    def is_stateless(self):
+        request = getattr(self, 'request', None)
+        if not self.is_stateless_request(request):
+            return False
+        view = (getattr(request, 'parser_context', None) or {}).get('view')
+        return getattr(view, 'stateless_auth', False)
+
+    @staticmethod
+    def get_user_id(validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        if self.is_stateless():
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+        return self.check_user(get_cached_user(user_id), validated_token)
+
+    @staticmethod
+    def check_user(user, validated_token):
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
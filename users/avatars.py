@@ -0,0 +1,62 @@
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# формат: (формат Pillow, расширение, параметры сохранения)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def open_avatar(file, size):
+    """
+    Декодирует изображение один раз. JPEG декодируется сразу в уменьшенном масштабе (draft),
+    если он намного больше нужного размера, - это в разы быстрее полного декодирования.
+    """
+
+    image = Image.open(file)
+    image.draft('RGB', (size, size))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        # прозрачный фон заменяется белым, иначе в JPEG он станет чёрным
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+    return image
+
+
+def make_thumbnails(storage, avatar_name, sizes=None):
+    """
+    Создаёт квадратные уменьшенные копии аватара во всех форматах THUMBNAIL_FORMATS
+    и сохраняет их в storage рядом с оригиналом. Каждая копия получается из предыдущей,
+    большей, поэтому полный размер обрабатывается только один раз.
+    Возвращает {размер: {формат: путь в хранилище}}.
+    """
+
+    sizes = sizes or settings.AVATAR_THUMBNAIL_SIZES
+    ordered = sorted(sizes.items(), key=lambda item: item[1], reverse=True)
+    root, _ = posixpath.splitext(avatar_name)
+
+    with storage.open(avatar_name, 'rb') as file:
+        image = open_avatar(file, ordered[0][1])
+
+    thumbnails = {}
+    for name, size in ordered:
+        image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        thumbnails[name] = {}
+        for thumbnail_format, (pillow_format, extension, options) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, pillow_format, **options)
+            path = storage.save(f'{root}_{name}.{extension}', ContentFile(buffer.getvalue()))
+            thumbnails[name][thumbnail_format] = path
+    return thumbnails
+
+
+def delete_thumbnails(storage, thumbnails):
+    for paths in thumbnails.values():
+        for path in paths.values():
+            storage.delete(path)
@@ -0,0 +1,151 @@
+import random
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from habits.cache import bump_public_version
+from habits.models import INTERVAL_TYPES, Habit
+from habits.schedule import get_schedule_index
+from users.models import User
+
+# популярные часы начала привычек (по МСК): утро, обед и вечер
+HOUR_WEIGHTS = {
+    6: 4, 7: 10, 8: 12, 9: 8, 10: 3, 11: 2, 12: 5, 13: 5, 14: 2, 15: 2,
+    16: 2, 17: 3, 18: 5, 19: 8, 20: 9, 21: 8, 22: 5, 23: 2, 0: 1, 1: 1,
+}
+INTERVAL_WEIGHTS = {'ежедневно': 60, 'раз в 2 дня': 10, 'раз в 3 дня': 10, 'еженедельно': 20}
+PLACES = ('Дом', 'Работа', 'Спортзал', 'Парк', 'Транспорт', 'Кафе')
+NICE_ACTIONS = ('Выпить кофе', 'Посмотреть серию', 'Послушать музыку', 'Прогуляться', 'Почитать книгу')
+USEFUL_ACTIONS = ('Сделать зарядку', 'Выпить стакан воды', 'Пробежать 3 км', 'Помедитировать',
+                  'Выучить 10 слов', 'Разобрать почту', 'Сделать растяжку', 'Лечь спать до 23:00')
+REWARDS = ('Десерт', 'Час отдыха', 'Любимый сериал', 'Новая книга')
+
+
+class Command(BaseCommand):
+    help = 'Создаёт пользователей и привычки с реалистичным распределением для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='количество пользователей')
+        parser.add_argument('--habits', type=int, default=1000, help='общее количество привычек')
+        parser.add_argument('--public-ratio', type=float, default=0.2, help='доля публичных привычек')
+        parser.add_argument('--nice-ratio', type=float, default=0.3, help='доля приятных привычек')
+        parser.add_argument('--related-ratio', type=float, default=0.5,
+                            help='доля полезных привычек со связанной приятной (остальные - с вознаграждением)')
+        parser.add_argument('--date', type=date.fromisoformat, default=None,
+                            help='дата, вокруг которой распределяется время начала (по умолчанию сегодня)')
+        parser.add_argument('--seed', type=int, default=42, help='начальное значение генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=5000, help='количество строк в одном INSERT')
+        parser.add_argument('--email-prefix', default='seed', help='префикс почты создаваемых пользователей')
+        parser.add_argument('--password', default='seed-password', help='пароль всех создаваемых пользователей')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['habits'] < 0:
+            raise CommandError('Нужен хотя бы один пользователь и неотрицательное количество привычек')
+        self.options = options
+        self.random = random.Random(options['seed'])
+        day = options['date'] or timezone.localdate()
+        # 00:00 МСК выбранной даты
+        self.midnight = datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc) - timedelta(hours=3)
+        self.hours = list(HOUR_WEIGHTS)
+        self.hour_weights = list(HOUR_WEIGHTS.values())
+        self.intervals = [interval for interval, _ in INTERVAL_TYPES]
+        self.interval_weights = [INTERVAL_WEIGHTS[interval] for interval in self.intervals]
+
+        started = time.monotonic()
+        with transaction.atomic():
+            users = self.create_users()
+            habits_count = self.create_habits(users)
+            transaction.on_commit(bump_public_version)
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, привычек: {habits_count} за {elapsed:.1f} с '
+            f'({(len(users) + habits_count) / elapsed:.0f} строк/с)'
+        ))
+
+        index = get_schedule_index()
+        if index is not None:
+            # bulk_create не вызывает сигналы, поэтому индекс расписания собирается заново
+            self.stdout.write(f'Индекс расписания перестроен: {index.rebuild()} привычек')
+
+    def create_users(self):
+        # хэширование пароля намеренно медленное, поэтому хэш один на всех
+        password = make_password(self.options['password'])
+        prefix = self.options['email_prefix']
+        users = [
+            User(email=f'{prefix}_{number}@example.com', first_name=f'User {number}', password=password,
+                 tg_chat_id=str(self.random.randrange(10 ** 8, 10 ** 10)), is_active=True)
+            for number in range(self.options['users'])
+        ]
+        return User.objects.bulk_create(users, batch_size=self.options['batch_size'])
+
+    def get_habit_counts(self, users_count):
+        """
+        Количество привычек у каждого пользователя: распределение Парето,
+        у немногих пользователей много привычек, у большинства - несколько.
+        """
+
+        weights = [self.random.paretovariate(1.5) for _ in range(users_count)]
+        total_weight = sum(weights)
+        counts = [int(self.options['habits'] * weight / total_weight) for weight in weights]
+        for number in range(self.options['habits'] - sum(counts)):
+            counts[number % users_count] += 1
+        return counts
+
+    def get_start_time(self):
+        hour = self.random.choices(self.hours, self.hour_weights)[0]
+        return self.midnight + timedelta(hours=hour, minutes=self.random.randrange(60))
+
+    def make_habit(self, owner, is_nice):
+        habit = Habit(
+            owner=owner,
+            place=self.random.choice(PLACES),
+            action=self.random.choice(NICE_ACTIONS if is_nice else USEFUL_ACTIONS),
+            is_nice=is_nice,
+            interval=self.random.choices(self.intervals, self.interval_weights)[0],
+            is_public=self.random.random() < self.options['public_ratio'],
+            start_time=self.get_start_time(),
+            duration=timedelta(seconds=self.random.choice((30, 60, 90, 120))),
+        )
+        habit.set_interval_days()
+        return habit
+
+    def create_habits(self, users):
+        """
+        Привычки создаются пачками: сначала приятные, затем полезные,
+        которые ссылаются на приятные привычки того же пользователя (related_to)
+        или получают вознаграждение. В памяти находится не больше одной пачки.
+        """
+
+        batch_size = self.options['batch_size']
+        nice_habits, useful_habits = [], []
+        count = 0
+        for user, habits_count in zip(users, self.get_habit_counts(len(users))):
+            user_nice_habits = []
+            for _ in range(habits_count):
+                if self.random.random() < self.options['nice_ratio']:
+                    habit = self.make_habit(user, is_nice=True)
+                    user_nice_habits.append(habit)
+                    nice_habits.append(habit)
+                    continue
+                habit = self.make_habit(user, is_nice=False)
+                if user_nice_habits and self.random.random() < self.options['related_ratio']:
+                    habit.related_to = self.random.choice(user_nice_habits)
+                else:
+                    habit.reward = self.random.choice(REWARDS)
+                useful_habits.append(habit)
+
+            if len(nice_habits) + len(useful_habits) >= batch_size:
+                count += self.flush(nice_habits, useful_habits)
+                nice_habits, useful_habits = [], []
+        return count + self.flush(nice_habits, useful_habits)
+
+    def flush(self, nice_habits, useful_habits):
+        # приятные привычки сохраняются первыми: после bulk_create у них есть id для related_to
+        Habit.objects.bulk_create(nice_habits)
+        Habit.objects.bulk_create(useful_habits)
+        return len(nice_habits) + len(useful_habits)
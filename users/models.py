@@ -11,6 +11,9 @@ class User(AbstractUser):
     tg_chat_id = models.CharField(max_length=10, verbose_name='телеграмм_id')
     first_name = models.CharField(max_length=20, verbose_name='имя')
     avatar = models.ImageField(verbose_name='аватар', **NULLABLE)
+    # уменьшенные копии аватара: {размер: {формат: путь в хранилище}}, заполняются задачей process_avatar
+    avatar_thumbnails = models.JSONField(default=dict, blank=True, verbose_name='уменьшенные аватары')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='изменён')
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
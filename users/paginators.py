@@ -0,0 +1,11 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class UserCursorPaginator(CursorPagination):
+    """ Курсорная пагинация списка пользователей по id: стоимость страницы не зависит от её глубины """
+
+    ordering = 'id'
+    page_size = settings.USERS_CURSOR_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.USERS_CURSOR_MAX_PAGE_SIZE
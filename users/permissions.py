@@ -4,7 +4,7 @@ from rest_framework.permissions import BasePermission
 class IsSelfUser(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        if obj == request.user:
+        if obj.pk == request.user.pk:
             return True
         else:
             return False
@@ -1,10 +1,55 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
+from config.mixins import SparseFieldsSerializerMixin, TimedSerializerMixin
 from users.models import User
 
 
-class UserSerializer(serializers.ModelSerializer):
+class AvatarField(serializers.ImageField):
+    """
+    Загружается исходное изображение, а в ответе - ссылка на его уменьшенную копию
+    AVATAR_DEFAULT_THUMBNAIL в WebP. Пока копии не готовы (см. process_avatar), отдаётся оригинал.
+    """
+
+    def get_attribute(self, instance):
+        return instance.avatar, instance.avatar_thumbnails
+
+    def to_representation(self, value):
+        avatar, thumbnails = value
+        path = thumbnails.get(settings.AVATAR_DEFAULT_THUMBNAIL, {}).get('webp')
+        if not avatar or path is None:
+            return super().to_representation(avatar)
+        if not getattr(self, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            return path
+        url = avatar.storage.url(path)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+
+class AvatarThumbnailsField(serializers.ReadOnlyField):
+    """ Ссылки на все уменьшенные копии аватара: {размер: {формат: ссылка}} """
+
+    def get_attribute(self, instance):
+        return instance.avatar, instance.avatar_thumbnails
+
+    def to_representation(self, value):
+        avatar, thumbnails = value
+        if not avatar:
+            return {}
+        request = self.context.get('request')
+        build_url = request.build_absolute_uri if request is not None else str
+        return {
+            size: {thumbnail_format: build_url(avatar.storage.url(path)) for thumbnail_format, path in paths.items()}
+            for size, paths in thumbnails.items()
+        }
+
+
+class UserSerializer(SparseFieldsSerializerMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    avatar = AvatarField(required=False, allow_null=True)
+    avatar_thumbnails = AvatarThumbnailsField()
 
     class Meta:
         model = User
         fields = '__all__'
+        extra_kwargs = {'password': {'write_only': True}}
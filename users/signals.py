@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import invalidate_user
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш аутентификации при изменении (в т.ч. блокировке) и удалении пользователя
+    после фиксации транзакции: иначе параллельный запрос успел бы закэшировать ещё не изменённую запись.
+    """
+
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user(user_id))
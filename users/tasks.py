@@ -0,0 +1,44 @@
+import logging
+
+from celery import shared_task
+from django.db.models.functions import Now
+from PIL import Image
+
+from users.authentication import invalidate_user
+from users.avatars import delete_thumbnails, make_thumbnails
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def process_avatar(user_id, avatar_name):
+    """
+    Создаёт уменьшенные копии загруженного аватара и сохраняет пути к ним у пользователя.
+    Если пока шла обработка аватар успели заменить, результат выбрасывается.
+    """
+
+    user = User.objects.filter(pk=user_id).only('avatar', 'avatar_thumbnails').first()
+    if user is None or user.avatar.name != avatar_name:
+        return None
+
+    storage = user.avatar.storage
+    try:
+        thumbnails = make_thumbnails(storage, avatar_name)
+    except (OSError, Image.DecompressionBombError) as exc:
+        logger.warning('Не удалось обработать аватар пользователя %s: %s', user_id, exc)
+        return None
+
+    # UPDATE с условием на avatar: параллельная замена аватара не получит чужие копии
+    updated = User.objects.filter(pk=user_id, avatar=avatar_name).update(
+        avatar_thumbnails=thumbnails, updated_at=Now()
+    )
+    if not updated:
+        delete_thumbnails(storage, thumbnails)
+        return None
+
+    # UPDATE не вызывает сигналы модели, поэтому кэш аутентификации сбрасывается явно
+    invalidate_user(user_id)
+    # копии прежней обработки этого же аватара (повторный запуск задачи)
+    delete_thumbnails(storage, user.avatar_thumbnails)
+    return thumbnails
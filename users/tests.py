@@ -1,8 +1,25 @@
+import csv
+import json
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from habits.models import Habit
+from users.authentication import get_cached_user, invalidate_user
 from users.models import User
+from users.tasks import process_avatar
 
 
 class UserAPITest(APITestCase):
@@ -46,3 +63,178 @@ class UserAPITest(APITestCase):
 
         response = self.client.get(f'/users/{self.user_1.pk}/')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_conditional_get(self):
+        """ Тестирование ETag при получении данных пользователя """
+
+        self.user_1 = User.objects.create(**self.data)
+        self.access_token = str(RefreshToken.for_user(self.user_1).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        url = f'/users/{self.user_1.pk}/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_sparse_fields(self):
+        """ Тестирование выбора полей ответа и скрытия пароля """
+
+        self.user_1 = User.objects.create(**self.data)
+        self.access_token = str(RefreshToken.for_user(self.user_1).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
+        response = self.client.get(f'/users/{self.user_1.pk}/')
+        self.assertNotIn('password', response.data)
+
+        response = self.client.get(f'/users/{self.user_1.pk}/?fields=email,tg_chat_id')
+        self.assertEqual(response.data, {'id': self.user_1.pk, 'email': 'Anna@mail.ru', 'tg_chat_id': '1234567890'})
+
+    def test_cached_authentication(self):
+        """ Тестирование кэша пользователей при JWT-аутентификации """
+
+        self.user_1 = User.objects.create(**self.data)
+        self.access_token = str(RefreshToken.for_user(self.user_1).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        url = f'/users/{self.user_1.pk}/?fields=email'
+
+        # пользователь кэшируется после фиксации транзакции, в которой он прочитан
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)
+        # пользователь по токену берётся из кэша, из БД читается только сам ресурс
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # каждый запрос получает свой экземпляр пользователя
+        self.assertIsNot(get_cached_user(self.user_1.pk), get_cached_user(self.user_1.pk))
+
+        # откатанные изменения в кэш не попадают
+        with transaction.atomic():
+            User.objects.filter(pk=self.user_1.pk).update(is_active=False)
+            invalidate_user(self.user_1.pk)
+            self.assertFalse(get_cached_user(self.user_1.pk).is_active)
+            transaction.set_rollback(True)
+        self.assertTrue(get_cached_user(self.user_1.pk).is_active)
+
+        # блокировка сбрасывает кэш
+        self.user_1.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_1.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_admin_list(self):
+        """ Тестирование постраничного списка пользователей для администратора """
+
+        admin = User.objects.create(email='admin@mail.ru', tg_chat_id='1', first_name='Admin', is_staff=True)
+        User.objects.bulk_create([User(email=f'user_{number}@mail.ru', tg_chat_id='1', first_name=f'User {number}')
+                                  for number in range(6)])
+        self.client.force_authenticate(admin)
+
+        url = '/users/?page_size=3'
+        emails = []
+        queries = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            emails += [user['email'] for user in response.data['results']]
+            queries.append(len(context))
+            url = response.data['next']
+        self.assertEqual(emails, list(User.objects.values_list('email', flat=True)))
+        # группы и права подгружаются на всю страницу, версия списка для ETag не считается
+        self.assertEqual(len(set(queries)), 1)
+        self.assertFalse(response.has_header('ETag'))
+
+        # колонки полей аватара читаются вместе со страницей, а не отдельным запросом на каждого пользователя
+        for fields in ('avatar', 'avatar_thumbnails'):
+            with self.assertNumQueries(queries[0]):
+                response = self.client.get(f'/users/?page_size=3&fields={fields}')
+            self.assertEqual(set(response.data['results'][0]), {'id', fields})
+
+    def test_export(self):
+        """ Тестирование потоковой выгрузки пользователей """
+
+        admin = User.objects.create(email='admin@mail.ru', tg_chat_id='1', first_name='Admin', is_staff=True)
+        User.objects.create(**self.data)
+        self.client.force_authenticate(admin)
+
+        response = self.client.get('/users/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row['email'] for row in rows], ['admin@mail.ru', 'Anna@mail.ru'])
+        self.assertNotIn('password', rows[0])
+
+        response = self.client.get('/users/export/?export_format=ndjson')
+        users = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(users[1]['tg_chat_id'], '1234567890')
+
+        response = self.client.get('/users/export/?export_format=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(User.objects.get(email='Anna@mail.ru'))
+        self.assertEqual(self.client.get('/users/export/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_seed_habits(self):
+        """ Тестирование генерации пользователей и привычек для нагрузочного тестирования """
+
+        def seed():
+            call_command('seed_habits', '--date=2024-01-17', users=10, habits=300, seed=7, batch_size=50,
+                         stdout=StringIO())
+            return list(Habit.objects.order_by('id').values_list('owner__email', 'action', 'start_time', 'interval'))
+
+        habits = seed()
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(len(habits), 300)
+        # связанные привычки - приятные привычки того же пользователя
+        related = Habit.objects.filter(related_to__isnull=False)
+        self.assertTrue(related.exists())
+        self.assertFalse(related.exclude(related_to__is_nice=True, related_to__owner=F('owner')).exists())
+        self.assertFalse(Habit.objects.filter(is_nice=True, reward__isnull=False).exists())
+        self.assertEqual(Habit.objects.filter(interval_days=7).count(),
+                         Habit.objects.filter(interval='еженедельно').count())
+        self.assertTrue(User.objects.first().check_password('seed-password'))
+
+        # тот же seed - те же данные
+        User.objects.all().delete()
+        self.assertEqual(seed(), habits)
+
+    def test_avatar(self):
+        """ Тестирование создания уменьшенных копий загруженного аватара """
+
+        user = User.objects.create(**self.data)
+        self.client.force_authenticate(user)
+        buffer = BytesIO()
+        Image.new('RGBA', (1200, 800), (255, 0, 0, 128)).save(buffer, 'PNG')
+        avatar = SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png')
+
+        # задача выполняется сразу, без брокера
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                mock.patch.object(process_avatar, 'delay', side_effect=process_avatar) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(f'/users/{user.pk}/', {'avatar': avatar}, format='multipart')
+            self.assertEqual(delay.call_args.args[0], user.pk)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # копии ещё не готовы, пока отдаётся оригинал
+            self.assertTrue(response.data['avatar'].endswith('avatar.png'))
+
+            response = self.client.get(f'/users/{user.pk}/?fields=avatar,avatar_thumbnails')
+            self.assertTrue(response.data['avatar'].endswith('avatar_small.webp'))
+            self.assertEqual(set(response.data['avatar_thumbnails']), {'small', 'medium'})
+            user.refresh_from_db()
+            for size, paths in user.avatar_thumbnails.items():
+                for path in paths.values():
+                    with user.avatar.storage.open(path) as file, Image.open(file) as image:
+                        self.assertEqual(image.size, (settings.AVATAR_THUMBNAIL_SIZES[size],) * 2)
+
+            # при замене аватара прежние копии удаляются
+            old_path = user.avatar_thumbnails['small']['webp']
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f'/users/{user.pk}/', {'avatar': None}, format='json')
+            user.refresh_from_db()
+            self.assertEqual(user.avatar_thumbnails, {})
+            self.assertFalse(user.avatar.storage.exists(old_path))
@@ -1,19 +1,80 @@
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAdminUser
 
+from config.export import csv_lines, ndjson_lines
+from config.mixins import ConditionalGetMixin, SparseFieldsMixin
+from users.avatars import delete_thumbnails
 from users.models import User
+from users.paginators import UserCursorPaginator
 from users.permissions import IsSelfUser
 from users.serializers import UserSerializer
+from users.tasks import process_avatar
 
+EXPORT_FIELDS = ('id', 'email', 'first_name', 'last_name', 'tg_chat_id',
+                 'is_active', 'is_staff', 'date_joined', 'last_login')
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
+
+
+class UserViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+    """
+    Пользователи.
+    Список для администратора постраничный (курсор по id), полная выгрузка -
+    export, которая отдаёт пользователей потоком и не держит всю таблицу в памяти.
+    """
 
-class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = UserCursorPaginator
+    sparse_required_fields = ('id', 'updated_at')
+    sparse_field_columns = {
+        'avatar': ('avatar', 'avatar_thumbnails'),
+        'avatar_thumbnails': ('avatar', 'avatar_thumbnails'),
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # группы и права сериализуются для всей страницы двумя запросами, а не на каждого пользователя
+            queryset = queryset.prefetch_related('groups', 'user_permissions')
+        return queryset
+
+    def get_list_version(self, request):
+        # версия списка - агрегат по всей таблице пользователей на каждую страницу, а курсорная
+        # пагинация как раз убирает запросы размером с таблицу; список для администратора отдаётся без ETag
+        return None
 
     def perform_create(self, serializer):
         user = serializer.save()
         user.set_password(user.password)
         user.save()
+        self.schedule_avatar_processing(user)
+
+    def perform_update(self, serializer):
+        if 'avatar' not in serializer.validated_data:
+            serializer.save()
+            return
+        # копии прежнего аватара больше не нужны, новые создаст process_avatar
+        thumbnails = serializer.instance.avatar_thumbnails
+        storage = serializer.instance.avatar.storage
+        user = serializer.save(avatar_thumbnails={})
+        transaction.on_commit(lambda: delete_thumbnails(storage, thumbnails))
+        self.schedule_avatar_processing(user)
+
+    @staticmethod
+    def schedule_avatar_processing(user):
+        """ Уменьшенные копии создаются в фоне: запрос не ждёт декодирования и сжатия изображения """
+
+        if user.avatar:
+            avatar_name = user.avatar.name
+            transaction.on_commit(lambda: process_avatar.delay(user.pk, avatar_name))
 
     def get_permissions(self):
         if self.action == 'create':
@@ -24,3 +85,22 @@ class UserViewSet(viewsets.ModelViewSet):
             self.permission_classes = [IsAdminUser]
 
         return [permission() for permission in self.permission_classes]
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Выгрузка всех пользователей: ?export_format=csv (по умолчанию) или ndjson.
+        Строки читаются из БД порциями по USERS_EXPORT_CHUNK_SIZE и сразу отдаются клиенту.
+        """
+
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'export_format': [f'Допустимые значения: {", ".join(EXPORT_FORMATS)}.']})
+        get_lines, content_type = EXPORT_FORMATS[export_format]
+
+        rows = User.objects.order_by('id').values_list(*EXPORT_FIELDS).iterator(
+            chunk_size=settings.USERS_EXPORT_CHUNK_SIZE
+        )
+        response = StreamingHttpResponse(get_lines(EXPORT_FIELDS, rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="users.{export_format}"'
+        return response